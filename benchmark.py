@@ -0,0 +1,366 @@
+"""Benchmark das etapas do pedido, sem Streamlit.
+
+Uso:
+    python benchmark.py [--tamanhos 1000 10000 100000] [--formatos xlsx csv docx txt]
+                        [--saida relatorio_benchmark.json] [--repeticoes N] [--sem-memoria]
+                        [--comparar RELATORIO_ANTERIOR.json] [--tolerancia 0.2]
+
+Gera listas sintéticas (nomes com acento e espaço sobrando, CPFs com e sem
+máscara, datas em vários formatos, valores "R$ 1.234,56") em cada formato
+aceito pela tela, mede tempo e pico de memória de cada etapa contra o
+PLANSIP3C_NOVA.xlsx e grava um relatório JSON. Com `--comparar`, mostra a
+razão de tempo contra um relatório anterior e sai com código 1 se alguma
+etapa ficou mais lenta que a tolerância.
+
+Cada item de `resultados` no relatório:
+
+    {"formato": "xlsx", "funcionarios": 10000, "etapa": "normalizacao",
+     "segundos": 0.081, "pico_mb": 12.4, "linhas": 10000}
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+import openpyxl
+import pandas as pd
+
+# Mapeamentos confirmados de outra execução deixariam a etapa de cabeçalho sem fuzzy
+os.environ.setdefault("PLUXEE_MAPEAMENTOS", os.path.join(tempfile.gettempdir(), "benchmark_mapeamentos.json"))
+
+from cabecalhos import resolver_cabecalho
+from leitura import achar_cabecalho, ler_lista, ler_word_txt
+from planilha import TEMPLATE_PADRAO, carregar_modelo, gerar_pedido, limpar_cache_celulas
+from tratamento import (converter_data, formatar_nome_pluxee, limpar_memo_datas, limpar_valor, normalizar_lista,
+                        separar_rejeitados)
+
+TAMANHOS_PADRAO = (1000, 10000, 100000)
+FORMATOS = ('xlsx', 'csv', 'docx', 'txt')
+SAIDA_PADRAO = "relatorio_benchmark.json"
+TOLERANCIA_PADRAO = 0.2
+MINIMO_COMPARAVEL = 0.01  # etapas mais rápidas que isso são só ruído na comparação
+
+CONFIG_RH = {
+    "Local de entrega": "MATRIZ", "CEP": "01310918", "Endereço": "AV PAULISTA", "Número": "1000",
+    "Complemento": "ANDAR 5", "Referência": "", "Bairro": "BELA VISTA", "Cidade": "SAO PAULO", "UF": "SP",
+    "Responsável": "FULANO DE TAL", "DDD": "11", "Telefone": "999999999", "Email": "rh@exemplo.com",
+    "Porta_a_Porta": "Não",
+}
+
+# ==========================================
+# LISTAS SINTÉTICAS
+# ==========================================
+
+_PRENOMES = ["José", "Maria", "João", "Ana", "Antônio", "Francisca", "Luís", "Conceição", "Márcio", "Cecília"]
+_SOBRENOMES = ["da Silva", "dos Santos", "Oliveira", "Souza", "de Assunção", "Gonçalves", "Araújo",
+               "Conceição", "Lima", "Fernandes", "Brandão", "Nogueira"]
+
+
+def _cpf(rnd):
+    base = [rnd.randrange(10) for _ in range(9)]
+    for n in (10, 11):
+        digito = sum(d * p for d, p in zip(base, range(n, 1, -1))) * 10 % 11
+        base.append(digito % 10)
+    return "".join(map(str, base))
+
+def funcionarios_sinteticos(n, semente=42):
+    """Linhas cruas (nome, cpf, nascimento, valor) com a bagunça das listas reais."""
+    rnd = random.Random(semente)
+    linhas = []
+    for _ in range(n):
+        nome = f"{rnd.choice(_PRENOMES)} {' '.join(rnd.sample(_SOBRENOMES, rnd.randint(1, 5)))}"
+        nome = rnd.choice([nome, nome.upper(), nome.lower(), f"  {nome} ", f"Nome: {nome}"])
+        cpf = _cpf(rnd)
+        cpf = rnd.choice([cpf, f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}", int(cpf)])
+        nasc = datetime(1950, 1, 1) + timedelta(days=rnd.randrange(20000))
+        nasc = rnd.choice([nasc, nasc.strftime("%d/%m/%Y"), nasc.strftime("%d/%m/%y"),
+                           nasc.strftime("%Y-%m-%d"), f"{nasc.day}/{nasc.month}/{nasc.year}", ""])
+        valor = rnd.randrange(10000, 200000) / 100
+        valor = rnd.choice([valor, f"R$ {valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", "."),
+                            f"{valor:.2f}", f"R${valor:.2f}".replace(".", ",")])
+        linhas.append((nome, cpf, nasc, valor))
+    return linhas
+
+_CABECALHO = ["Matrícula", "Nome Completo do Colaborador", "CPF", "Dt. Nascimento", "Setor", "Valor do Benef. (R$)"]
+
+
+def _linhas_planilha(funcionarios):
+    yield ["Relação de colaboradores - ACME LTDA"]
+    yield []
+    yield _CABECALHO
+    for i, (nome, cpf, nasc, valor) in enumerate(funcionarios, 1):
+        yield [i, nome, cpf, nasc, "ADM", valor]
+
+def escrever_xlsx(funcionarios, caminho):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for linha in _linhas_planilha(funcionarios):
+        ws.append(linha)
+    wb.save(caminho)
+
+def escrever_csv(funcionarios, caminho):
+    linhas = list(_linhas_planilha(funcionarios))
+    pd.DataFrame(linhas[2:]).to_csv(caminho, header=False, index=False)
+
+def _linhas_texto(funcionarios):
+    for nome, cpf, nasc, _ in funcionarios:
+        yield nome
+        yield f"CPF: {cpf}"
+        if nasc:
+            yield f"Nasc: {nasc.strftime('%d/%m/%Y') if isinstance(nasc, datetime) else nasc}"
+
+def escrever_txt(funcionarios, caminho):
+    with open(caminho, "w", encoding="utf-8") as f:
+        for linha in _linhas_texto(funcionarios):
+            f.write(linha + "\n")
+
+_DOCX_TIPOS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+def escrever_docx(funcionarios, caminho):
+    # Documento mínimo, um parágrafo por linha, como uma lista colada no Word
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", _DOCX_TIPOS)
+        z.writestr("_rels/.rels", _DOCX_RELS)
+        with z.open("word/document.xml", "w") as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                    b'<w:body>')
+            for linha in _linhas_texto(funcionarios):
+                f.write(f'<w:p><w:r><w:t xml:space="preserve">{escape(linha)}</w:t></w:r></w:p>'.encode("utf-8"))
+            f.write(b'</w:body></w:document>')
+
+ESCRITORES = {'xlsx': escrever_xlsx, 'csv': escrever_csv, 'docx': escrever_docx, 'txt': escrever_txt}
+
+# ==========================================
+# MEDIÇÃO
+# ==========================================
+
+def _esvaziar_memorias():
+    # As datas e as células já vistas ficariam na memória entre etapas, tamanhos
+    # (a lista de 1k é o começo da de 10k) e repetições: o tempo seria só de acerto no cache
+    limpar_memo_datas()
+    limpar_cache_celulas()
+
+def medir(funcao, repeticoes=1, memoria=True):
+    """Roda `funcao` e devolve (resultado, melhor tempo em segundos, pico de memória em MB ou None).
+
+    Cada passada começa com os caches de datas e de células vazios.
+    """
+    melhor = None
+    for _ in range(max(1, repeticoes)):
+        _esvaziar_memorias()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        segundos = time.perf_counter() - inicio
+        melhor = segundos if melhor is None else min(melhor, segundos)
+    pico = None
+    if memoria:
+        # Passada separada: o tracemalloc deixa o código mais lento e estragaria o tempo
+        _esvaziar_memorias()
+        tracemalloc.start()
+        try:
+            funcao()
+            pico = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return resultado, melhor, pico
+
+def _contar(resultado):
+    # Leitura -> linhas da lista; gerar_pedido já devolve o número de linhas gravadas
+    resultado = getattr(resultado, 'lista', resultado)
+    if isinstance(resultado, pd.DataFrame):
+        return len(resultado)
+    return resultado if isinstance(resultado, int) else None
+
+def medir_etapas(formato, caminho, funcionarios, template_path, repeticoes, memoria):
+    """Tempo e memória de cada etapa para uma lista já gravada em `caminho`."""
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    nome = os.path.basename(caminho)
+    resultados = []
+
+    def etapa(nome_etapa, funcao):
+        resultado, segundos, pico = medir(funcao, repeticoes, memoria)
+        resultados.append({
+            'formato': formato, 'funcionarios': funcionarios, 'etapa': nome_etapa,
+            'segundos': round(segundos, 4), 'pico_mb': None if pico is None else round(pico, 2),
+            'linhas': _contar(resultado),
+        })
+        return resultado
+
+    if formato in ('docx', 'txt'):
+        bruto = etapa('leitura_bruta', lambda: ler_word_txt(nome, conteudo))
+        colunas = ('nome', 'cpf', 'nascimento', None)
+    else:
+        if formato == 'csv':
+            bruto = etapa('leitura_bruta', lambda: pd.read_csv(io.BytesIO(conteudo), header=None))
+        else:
+            bruto = etapa('leitura_bruta', lambda: pd.read_excel(io.BytesIO(conteudo), header=None))
+        start_row, headers = achar_cabecalho(bruto)
+        campos = etapa('cabecalho', lambda: resolver_cabecalho(headers)).campos
+        bruto = bruto.iloc[start_row + 1:].reset_index(drop=True)
+        bruto.columns = headers
+        colunas = (campos['nome'], campos['cpf'], campos['nascimento'], campos['valor'])
+
+    etapa('normalizacao', lambda: normalizar_lista(bruto, *colunas))
+    leitura = etapa('ler_lista', lambda: ler_lista(nome, conteudo, colunas[3] is not None))
+    etapa('validacao_cpf', lambda: separar_rejeitados(leitura.lista)[0])
+    etapa('gravacao', lambda: gerar_pedido(template_path, leitura.lista, CONFIG_RH, colunas[3] is not None,
+                                           io.BytesIO(), dt_cred="01/01/2030"))
+    return resultados
+
+def medir_funcoes(funcionarios, repeticoes, memoria):
+    """As funções linha a linha do tratamento, sobre os valores crus da lista."""
+    nomes, _, datas, valores = zip(*funcionarios)
+    n = len(funcionarios)
+    resultados = []
+    for nome_etapa, funcao in (
+        ('formatar_nome_pluxee', lambda: [formatar_nome_pluxee(v) for v in nomes]),
+        ('converter_data', lambda: [converter_data(v, "01/01/1980") for v in datas]),
+        ('limpar_valor', lambda: [limpar_valor(v) for v in valores]),
+    ):
+        _, segundos, pico = medir(funcao, repeticoes, memoria)
+        resultados.append({
+            'formato': 'funcoes', 'funcionarios': n, 'etapa': nome_etapa, 'segundos': round(segundos, 4),
+            'pico_mb': None if pico is None else round(pico, 2), 'linhas': n,
+        })
+    return resultados
+
+def medir_modelo(template_path, repeticoes, memoria):
+    """Carga do modelo a frio (cópia com outro caminho, fora do cache) e a quente."""
+    with tempfile.TemporaryDirectory() as pasta:
+        copias = itertools.count()
+
+        def a_frio():
+            copia = os.path.join(pasta, f"modelo_{next(copias)}.xlsx")
+            shutil.copyfile(template_path, copia)
+            return carregar_modelo(copia)
+
+        resultados = []
+        carregar_modelo(template_path)
+        for nome_etapa, funcao in (('modelo_frio', a_frio), ('modelo_cache', lambda: carregar_modelo(template_path))):
+            _, segundos, pico = medir(funcao, repeticoes, memoria)
+            resultados.append({
+                'formato': 'modelo', 'funcionarios': 0, 'etapa': nome_etapa, 'segundos': round(segundos, 4),
+                'pico_mb': None if pico is None else round(pico, 2), 'linhas': None,
+            })
+    return resultados
+
+def _versao():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def rodar(tamanhos=TAMANHOS_PADRAO, formatos=FORMATOS, template_path=TEMPLATE_PADRAO, repeticoes=1,
+          memoria=True, pasta=None, progresso=None):
+    """Gera as listas, mede todas as etapas e devolve o relatório (dict)."""
+    relatorio = {
+        'versao': _versao(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'maquina': platform.platform(),
+        'repeticoes': repeticoes,
+        'resultados': medir_modelo(template_path, repeticoes, memoria),
+    }
+    with tempfile.TemporaryDirectory(dir=pasta) as temporaria:
+        for n in tamanhos:
+            funcionarios = funcionarios_sinteticos(n)
+            relatorio['resultados'] += medir_funcoes(funcionarios, repeticoes, memoria)
+            for formato in formatos:
+                caminho = os.path.join(temporaria, f"lista_{n}.{formato}")
+                ESCRITORES[formato](funcionarios, caminho)
+                relatorio['resultados'] += medir_etapas(formato, caminho, n, template_path, repeticoes, memoria)
+                os.remove(caminho)
+                if progresso:
+                    progresso(f"{formato} {n}")
+    return relatorio
+
+# ==========================================
+# COMPARAÇÃO ENTRE VERSÕES
+# ==========================================
+
+def _chave(r):
+    return r['formato'], r['funcionarios'], r['etapa']
+
+def comparar(atual, anterior, tolerancia=TOLERANCIA_PADRAO):
+    """Linhas (chave, segundos antes, segundos agora, razão) e a lista das que pioraram além da tolerância."""
+    antes = {_chave(r): r for r in anterior['resultados']}
+    linhas, piores = [], []
+    for r in atual['resultados']:
+        base = antes.get(_chave(r))
+        if base is None or base['segundos'] < MINIMO_COMPARAVEL:
+            continue
+        razao = r['segundos'] / base['segundos']
+        linhas.append((_chave(r), base['segundos'], r['segundos'], razao))
+        if razao > 1 + tolerancia:
+            piores.append(_chave(r))
+    return linhas, piores
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mede tempo e memória de cada etapa do pedido com listas sintéticas.")
+    ap.add_argument("--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO),
+                    help="Quantidades de funcionários (padrão: 1000 10000 100000)")
+    ap.add_argument("--formatos", nargs="+", choices=FORMATOS, default=list(FORMATOS), help="Formatos de lista")
+    ap.add_argument("--saida", default=SAIDA_PADRAO, help=f"Relatório JSON (padrão: ./{SAIDA_PADRAO})")
+    ap.add_argument("--repeticoes", type=int, default=1, help="Execuções por etapa; vale o menor tempo")
+    ap.add_argument("--sem-memoria", action="store_true", help="Não mede pico de memória (mais rápido)")
+    ap.add_argument("--template", default=TEMPLATE_PADRAO, help="Modelo PLANSIP3C a usar")
+    ap.add_argument("--comparar", help="Relatório anterior para comparar os tempos")
+    ap.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                    help="Quanto uma etapa pode ficar mais lenta na comparação (0.2 = 20%%)")
+    args = ap.parse_args(argv)
+
+    relatorio = rodar(args.tamanhos, args.formatos, args.template, args.repeticoes, not args.sem_memoria,
+                      progresso=lambda msg: print(f"... {msg}", file=sys.stderr))
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=1)
+
+    for r in relatorio['resultados']:
+        pico = "-" if r['pico_mb'] is None else f"{r['pico_mb']:.1f} MB"
+        print(f"{r['formato']:>7} {r['funcionarios']:>7} {r['etapa']:<22} {r['segundos']:>9.4f}s {pico:>10}")
+    print(f"Relatório gravado em {args.saida}")
+
+    if not args.comparar:
+        return 0
+    with open(args.comparar, encoding="utf-8") as f:
+        anterior = json.load(f)
+    linhas, piores = comparar(relatorio, anterior, args.tolerancia)
+    print(f"\nComparação com {args.comparar} (versão {anterior.get('versao') or '?'}):")
+    for (formato, n, etapa), antes, agora, razao in linhas:
+        marca = "  <-- mais lento" if (formato, n, etapa) in piores else ""
+        print(f"{formato:>7} {n:>7} {etapa:<22} {antes:>9.4f}s -> {agora:>9.4f}s  x{razao:.2f}{marca}")
+    return 1 if piores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
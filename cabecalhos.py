@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+
+from rapidfuzz import fuzz, process
+from unidecode import unidecode
+
+# ==========================================
+# IDENTIFICAÇÃO DAS COLUNAS DA LISTA
+# ==========================================
+# Cada campo tem uma lista de sinônimos já normalizados (sem acento, minúsculo)
+# e termos que descartam a coluna ("nome da mãe", "cpf do dependente"). A
+# ordem de resolução é: mapeamento já confirmado para esse mesmo cabeçalho,
+# sinônimo exato e, por último, fuzzy (rapidfuzz) contra os sinônimos. No
+# fuzzy, um campo com trecho em EXIGIR só considera cabeçalhos que o contêm:
+# "data de nascimento" parece demais com "data de admissão" para o WRatio.
+
+CAMPOS = ('nome', 'cpf', 'nascimento', 'valor')
+OBRIGATORIOS = ('nome', 'cpf')
+LIMIAR = 70
+
+_PARENTES = ['mae', 'pai', 'dependente', 'conjuge', 'filho', 'filha', 'responsavel']
+
+SINONIMOS = {
+    'nome': ['nome', 'nome completo', 'nome do funcionario', 'nome funcionario', 'nome do colaborador',
+             'nome colaborador', 'nome do beneficiario', 'nome beneficiario', 'nome do empregado',
+             'funcionario', 'colaborador', 'beneficiario', 'empregado'],
+    'cpf': ['cpf', 'n cpf', 'no cpf', 'numero cpf', 'numero do cpf', 'cpf do funcionario',
+            'cpf do colaborador', 'cpf do beneficiario'],
+    'nascimento': ['nascimento', 'data de nascimento', 'data nascimento', 'dt nascimento',
+                   'dt nasc', 'data nasc', 'nasc', 'dt de nascimento'],
+    'valor': ['valor', 'valor beneficio', 'valor do beneficio', 'valor credito', 'valor de credito',
+              'valor do credito', 'valor recarga', 'valor da recarga', 'credito', 'valor total'],
+}
+
+EXCLUIR = {
+    'nome': _PARENTES + ['empresa', 'fantasia', 'razao', 'departamento', 'setor', 'cargo', 'funcao',
+                         'gestor', 'centro', 'cidade', 'bairro', 'rua', 'logradouro', 'banco'],
+    'cpf': _PARENTES,
+    'nascimento': _PARENTES + ['admissao', 'desligamento', 'demissao', 'contratacao'],
+    'valor': ['desconto', 'coparticipacao'],
+}
+
+EXIGIR = {'nascimento': 'nasc'}
+
+MAPEAMENTOS_PATH = os.environ.get(
+    "PLUXEE_MAPEAMENTOS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapeamentos_cabecalho.json"),
+)
+
+# Sobe a cada mudança em SINONIMOS/EXCLUIR/EXIGIR: mapeamentos confirmados com
+# regras antigas (ex.: "data de admissão" como nascimento) deixam de valer
+VERSAO_REGRAS = 2
+
+# assinatura: hash do cabeçalho normalizado; campos: {campo: cabeçalho original ou None}
+# cabecalho: os cabeçalhos da lista, para a tela oferecer as opções
+Resolucao = namedtuple("Resolucao", "assinatura campos confirmada cabecalho")
+
+
+def normalizar_cabecalho(texto):
+    texto = unidecode(str(texto)).lower()
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', texto).split())
+
+def assinatura_cabecalho(headers):
+    normalizados = "\x1f".join(normalizar_cabecalho(h) for h in headers)
+    return hashlib.sha1(normalizados.encode("utf-8")).hexdigest()
+
+def _excluida(h_norm, campo):
+    palavras = set(h_norm.split())
+    return any(t in palavras for t in EXCLUIR[campo])
+
+def _melhor_nota(campo, normalizados, grupo):
+    notas = process.cdist([normalizados[i] for i in grupo], SINONIMOS[campo], scorer=fuzz.WRatio)
+    melhor = int(notas.max(axis=1).argmax())
+    return grupo[melhor], float(notas[melhor].max())
+
+def _melhor_coluna(campo, normalizados, usados):
+    # Células vazias do cabeçalho chegam como 'nan'
+    candidatos = [i for i, h in enumerate(normalizados) if i not in usados and h not in ('', 'nan', 'none')]
+    livres = [i for i in candidatos if not _excluida(normalizados[i], campo)]
+
+    sinonimos = set(SINONIMOS[campo])
+    for i in livres:
+        if normalizados[i] in sinonimos:
+            return i, 100
+
+    # Sem sinônimo exato: melhor nota de cada coluna contra todos os sinônimos.
+    # Coluna com termo excluído só vale se nenhuma limpa chegar ao limiar (ex.:
+    # a lista só tem "nome da mãe"), e ainda assim só se tiver nota maior.
+    if campo in EXIGIR:
+        livres = [i for i in livres if EXIGIR[campo] in normalizados[i]]
+        candidatos = [i for i in candidatos if EXIGIR[campo] in normalizados[i]]
+    escolha = (None, 0)
+    for grupo in (livres, candidatos):
+        if grupo:
+            i, nota = _melhor_nota(campo, normalizados, grupo)
+            if nota > escolha[1]:
+                escolha = (i, nota)
+            if escolha[1] >= LIMIAR:
+                break
+    return escolha
+
+def _resolver_fuzzy(headers):
+    normalizados = [normalizar_cabecalho(h) for h in headers]
+    campos, usados = {}, set()
+    for campo in CAMPOS:
+        i, nota = _melhor_coluna(campo, normalizados, usados)
+        if i is None or (campo not in OBRIGATORIOS and nota < LIMIAR):
+            campos[campo] = None
+            continue
+        campos[campo] = headers[i]
+        usados.add(i)
+    return campos
+
+# ==========================================
+# MAPEAMENTOS CONFIRMADOS
+# ==========================================
+# Quando o usuário confere (e corrige, se precisar) as colunas na tela, o
+# mapeamento fica salvo pelo hash do cabeçalho, junto com a VERSAO_REGRAS. O
+# próximo upload do mesmo cliente (mesmo layout) é resolvido só com uma
+# consulta ao dicionário; entradas de outra versão são ignoradas.
+
+_confirmados = None
+_trava_confirmados = threading.Lock()
+
+
+def _carregar_confirmados():
+    global _confirmados
+    if _confirmados is None:
+        try:
+            with open(MAPEAMENTOS_PATH, encoding="utf-8") as f:
+                _confirmados = json.load(f)
+        except (OSError, ValueError):
+            _confirmados = {}
+    return _confirmados
+
+def resolver_cabecalho(headers):
+    """Descobre qual cabeçalho corresponde a cada campo (nome, cpf, nascimento, valor)."""
+    assinatura = assinatura_cabecalho(headers)
+    with _trava_confirmados:
+        salvo = _carregar_confirmados().get(assinatura)
+    if isinstance(salvo, dict) and salvo.get('versao') == VERSAO_REGRAS:
+        campos = salvo.get('campos') or {}
+        if all(campos.get(c) is None or campos[c] in headers for c in CAMPOS):
+            return Resolucao(assinatura, {c: campos.get(c) for c in CAMPOS}, True, list(headers))
+    return Resolucao(assinatura, _resolver_fuzzy(headers), False, list(headers))
+
+def confirmar_cabecalho(resolucao, campos=None):
+    """Grava o mapeamento conferido na tela para os próximos uploads com o mesmo cabeçalho.
+
+    `campos` substitui o que foi detectado (correção do usuário); sem ele, vale `resolucao.campos`.
+    """
+    if resolucao is None:
+        return
+    campos = {c: (campos or resolucao.campos).get(c) for c in CAMPOS}
+    if resolucao.confirmada and campos == resolucao.campos:
+        return
+    with _trava_confirmados:
+        confirmados = _carregar_confirmados()
+        confirmados[resolucao.assinatura] = {'versao': VERSAO_REGRAS, 'campos': campos}
+        temporario = f"{MAPEAMENTOS_PATH}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(confirmados, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, MAPEAMENTOS_PATH)
+        except OSError:
+            # Sem permissão de escrita: o mapeamento vale só para este processo
+            pass
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from itertools import chain
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from unidecode import unidecode
+
+from medicao import etapa
+from planilha import (COD_PRIMEIRA_VIA, COD_RECARGA, MARCA_CREDITO, PRIMEIRA_LINHA, PRODUTOS, carregar_modelo,
+                      endereco_pedido, escrever_planilha, montar_linhas, montar_trecho, nome_arquivo_saida)
+
+# ==========================================
+# HISTÓRICO DE PEDIDOS POR CLIENTE
+# ==========================================
+# A recarga de um cliente costuma repetir a do mês anterior: mesmos CPFs e
+# endereço, alguns valores diferentes. Guardamos, por cliente (prefixo do
+# arquivo, ex. RECARGA_ACMELTDA) e por CPF, os dados tratados do último pedido
+# e o XML já montado das linhas de cada funcionário. No pedido seguinte só os
+# funcionários novos ou alterados são montados de novo; o resto sai do banco.
+# O XML guardado só vale para o mesmo modelo, endereço e tipo de pedido
+# (`assinatura`); se algum deles mudar, tudo é montado de novo.
+# Montar e comprimir esse XML custa mais que gravar a linha direto, então o
+# pedido é gravado pelo caminho normal para quem não foi reaproveitado, e o XML
+# novo só é montado em `guardar_pedido`, depois de o arquivo ser entregue.
+
+HISTORICO_DB_PATH = os.environ.get(
+    "PLUXEE_HISTORICO_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "historico_pedidos.sqlite3"),
+)
+CAMPOS_COMPARADOS = ['nome', 'nascimento', 'valor']
+# Razões sociais padrão da tela e do serviço, antes de a empresa ser informada
+NOMES_PROVISORIOS = ("Cliente_Novo", "Cliente_Legado", "Cliente")
+AVISO_PROGRESSO = 2000  # funcionários gravados entre duas chamadas de `progresso`
+DIFERENCAS_GUARDADAS = 8
+
+# novos/alterados/removidos: DataFrames (cpf, nome); mantidos: quantos ficaram iguais
+# primeiro: não havia pedido anterior para este cliente
+Diferenca = namedtuple("Diferenca", "novos alterados removidos mantidos primeiro")
+# Pedido já gravado no arquivo e ainda não guardado no histórico. montar: máscara
+# das linhas sem XML guardado; parcial: só elas (e os removidos) mudam no banco;
+# base: gerado_em do pedido anterior com que ele foi comparado
+PedidoPendente = namedtuple("PedidoPendente", "template_path cliente assinatura lista config cod_pedido trechos "
+                                              "montar parcial removidos base")
+
+_diferencas = OrderedDict()
+_trava_diferencas = threading.Lock()
+
+
+def _sem_simbolos(razao_social):
+    return re.sub(r'[^a-z0-9]', '', unidecode(str(razao_social or '')).lower())
+
+def prefixo_cliente(razao_social, recarga):
+    """Chave do cliente no histórico: o nome do arquivo de saída sem a extensão.
+
+    None quando a razão social está vazia ou é um dos nomes provisórios da
+    tela: todo mundo que não digitou o nome cairia na mesma chave e seria
+    comparado com o pedido de outra empresa.
+    """
+    chave = _sem_simbolos(razao_social)
+    if not chave or chave in {_sem_simbolos(n) for n in NOMES_PROVISORIOS}:
+        return None
+    return os.path.splitext(nome_arquivo_saida(razao_social, recarga))[0]
+
+def _assinatura(modelo, config, cod_pedido):
+    partes = [modelo.hash, cod_pedido, PRODUTOS, endereco_pedido(config)]
+    return hashlib.sha1(json.dumps(partes, default=str).encode("utf-8")).hexdigest()
+
+class HistoricoPedidos:
+    """Último pedido gerado de cada cliente, guardado em SQLite."""
+
+    def __init__(self, db_path=HISTORICO_DB_PATH):
+        self.db_path = db_path
+        # guardar_pedido pode rodar numa thread depois da entrega: um de cada vez
+        self.trava = threading.Lock()
+        self._criar_tabelas()
+
+    def _conectar(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _criar_tabelas(self):
+        with self._conectar() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS pedidos (
+                    cliente TEXT PRIMARY KEY,
+                    assinatura TEXT NOT NULL,
+                    gerado_em TEXT NOT NULL,
+                    funcionarios INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS funcionarios (
+                    cliente TEXT NOT NULL,
+                    cpf TEXT NOT NULL,
+                    nome TEXT,
+                    nascimento TEXT,
+                    valor REAL,
+                    trecho BLOB,
+                    PRIMARY KEY (cliente, cpf)
+                );
+            """)
+
+    def anterior(self, cliente, com_trechos=True):
+        """(assinatura, DataFrame cpf/nome/nascimento/valor/trecho) do último pedido; (None, vazio) se não há."""
+        colunas = "cpf, nome, nascimento, valor" + (", trecho" if com_trechos else "")
+        with self._conectar() as db:
+            linha = db.execute("SELECT assinatura FROM pedidos WHERE cliente = ?", (cliente,)).fetchone()
+            quadro = pd.read_sql_query(f"SELECT {colunas} FROM funcionarios WHERE cliente = ?",
+                                       db, params=(cliente,))
+        return (linha[0] if linha else None), quadro
+
+    def gerado_em(self, cliente):
+        """Quando o último pedido do cliente foi guardado (None se não há): muda a cada `gravar`."""
+        with self._conectar() as db:
+            linha = db.execute("SELECT gerado_em FROM pedidos WHERE cliente = ?", (cliente,)).fetchone()
+        return linha[0] if linha else None
+
+    def gravar(self, cliente, assinatura, lista, trechos, alterados=None, removidos=()):
+        """Guarda o pedido que acabou de ser gerado como o último do cliente.
+
+        Sem `alterados`, troca tudo. Com `alterados` (máscara das linhas da
+        lista que mudaram), só essas são regravadas e os CPFs de `removidos`
+        saem do banco; o resto já está lá igual.
+        """
+        linhas = zip(lista['cpf'], lista['nome'], lista['nascimento'], lista['valor'].astype(float), trechos)
+        if alterados is not None:
+            linhas = (linha for linha, mudou in zip(linhas, alterados) if mudou)
+        with self._conectar() as db:
+            if alterados is None:
+                db.execute("DELETE FROM funcionarios WHERE cliente = ?", (cliente,))
+            else:
+                db.executemany("DELETE FROM funcionarios WHERE cliente = ? AND cpf = ?",
+                               ((cliente, cpf) for cpf in removidos))
+            # CPF repetido na lista: fica o último, como numa planilha lida de cima para baixo
+            db.executemany(
+                "INSERT OR REPLACE INTO funcionarios (cliente, cpf, nome, nascimento, valor, trecho) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((cliente, cpf, nome, nasc, valor, trecho) for cpf, nome, nasc, valor, trecho in linhas),
+            )
+            db.execute(
+                "INSERT INTO pedidos (cliente, assinatura, gerado_em, funcionarios) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (cliente) DO UPDATE SET assinatura = excluded.assinatura, "
+                "gerado_em = excluded.gerado_em, funcionarios = excluded.funcionarios",
+                (cliente, assinatura, datetime.now().isoformat(timespec='microseconds'), len(lista)),
+            )
+
+    def esquecer(self, cliente):
+        with self._conectar() as db:
+            db.execute("DELETE FROM funcionarios WHERE cliente = ?", (cliente,))
+            db.execute("DELETE FROM pedidos WHERE cliente = ?", (cliente,))
+
+
+def _comparar(lista, anterior):
+    """Diferença e, para cada linha da lista, o registro igual do pedido anterior (ou None)."""
+    base = lista[['cpf', 'nome']].reset_index(drop=True)
+    if anterior.empty:
+        vazio = pd.DataFrame(columns=['cpf', 'nome'])
+        return Diferenca(base, vazio, vazio, 0, True), np.zeros(len(lista), dtype=bool), None
+
+    # Cada linha da lista com o registro do mesmo CPF no pedido anterior (NaN se não havia)
+    cruzado = anterior.drop_duplicates('cpf', keep='last').set_index('cpf').reindex(lista['cpf'].to_numpy())
+    existia = cruzado['nome'].notna().to_numpy()
+    iguais = existia.copy()
+    for campo in CAMPOS_COMPARADOS:
+        novo, velho = lista[campo].to_numpy(), cruzado[campo].to_numpy()
+        if campo == 'valor':
+            novo, velho = novo.astype(float), velho.astype(float)
+        iguais &= (novo == velho)
+    removidos = anterior.loc[~anterior['cpf'].isin(lista['cpf']), ['cpf', 'nome']].reset_index(drop=True)
+    diferenca = Diferenca(base[~existia].reset_index(drop=True), base[existia & ~iguais].reset_index(drop=True),
+                          removidos, int(iguais.sum()), False)
+    return diferenca, iguais, cruzado
+
+def diferenca_para_anterior(cliente, lista, historico=None, chave_lista=None):
+    """Só a comparação com o último pedido do cliente, sem gerar nada: para mostrar na tela.
+
+    Com `chave_lista` (ex.: hash do upload), o resultado fica guardado até o
+    histórico do cliente mudar: a tela reexecuta a cada tecla e reler o
+    histórico inteiro do SQLite custa mais de um segundo com 80 mil CPFs.
+    """
+    historico = historico or HistoricoPedidos()
+    chave = None
+    if chave_lista is not None:
+        chave = (historico.db_path, cliente, historico.gerado_em(cliente), chave_lista)
+        with _trava_diferencas:
+            if chave in _diferencas:
+                _diferencas.move_to_end(chave)
+                return _diferencas[chave]
+    _, anterior = historico.anterior(cliente, com_trechos=False)
+    diferenca = _comparar(lista, anterior)[0]
+    if chave is not None:
+        with _trava_diferencas:
+            _diferencas[chave] = diferenca
+            while len(_diferencas) > DIFERENCAS_GUARDADAS:
+                _diferencas.popitem(last=False)
+    return diferenca
+
+def _avisando(funcionarios, progresso):
+    feitos = 0
+    for linhas in funcionarios:
+        yield linhas
+        feitos += 1
+        if feitos % AVISO_PROGRESSO == 0:
+            progresso(feitos)
+    progresso(feitos)
+
+def _linhas_por_funcionario(trechos, reaproveitar, linhas_novas, campos):
+    # Quem não mudou sai do XML guardado; o resto vai como valores, igual ao gerar_pedido
+    por_funcionario = len(PRODUTOS)
+    for i, reaproveitada in enumerate(reaproveitar):
+        if reaproveitada:
+            yield [(zlib.decompress(trechos[i]).decode("utf-8"), por_funcionario, campos)]
+        else:
+            yield [next(linhas_novas) for _ in range(por_funcionario)]
+
+def gerar_pedido_incremental(template_path, lista, config, recarga, destino, cliente, historico=None,
+                             dt_cred=None, progresso=None):
+    """Como `gerar_pedido`, reaproveitando as linhas do último pedido do cliente.
+
+    Devolve (linhas escritas, Diferenca, PedidoPendente). O histórico só muda
+    quando o pendente é passado a `guardar_pedido`, o que pode ficar para
+    depois de o arquivo ser entregue. `progresso` (opcional) é chamado com
+    quantos funcionários já foram gravados, a cada AVISO_PROGRESSO e no fim.
+    """
+    historico = historico or HistoricoPedidos()
+    if dt_cred is None:
+        dt_cred = (datetime.now() + relativedelta(months=1)).strftime('%d/%m/%Y')
+    cod_pedido = COD_RECARGA if recarga else COD_PRIMEIRA_VIA
+    modelo = carregar_modelo(template_path)
+    assinatura = _assinatura(modelo, config, cod_pedido)
+    lista = lista.reset_index(drop=True)
+
+    base = historico.gerado_em(cliente)
+    assinatura_anterior, anterior = historico.anterior(cliente)
+    diferenca, iguais, cruzado = _comparar(lista, anterior)
+    # Outro modelo, endereço ou tipo de pedido: o XML guardado não serve mais
+    mesma_assinatura = assinatura_anterior == assinatura
+    reaproveitar = iguais if mesma_assinatura else np.zeros(len(lista), dtype=bool)
+    trechos = cruzado['trecho'].to_numpy().copy() if reaproveitar.any() else np.empty(len(lista), dtype=object)
+
+    campos = {'credito': escape(str(dt_cred))}
+    funcionarios = _linhas_por_funcionario(trechos, reaproveitar,
+                                           montar_linhas(lista[~reaproveitar], config, cod_pedido, dt_cred), campos)
+    if progresso is not None:
+        funcionarios = _avisando(funcionarios, progresso)
+    with etapa("gravacao", recarga=bool(recarga), reaproveitadas=int(reaproveitar.sum())) as e:
+        escritas = escrever_planilha(template_path, chain.from_iterable(funcionarios), destino, PRIMEIRA_LINHA)
+        e.linhas = escritas
+
+    parcial = mesma_assinatura and not diferenca.primeiro
+    pendente = PedidoPendente(template_path, cliente, assinatura, lista, config, cod_pedido, trechos, ~reaproveitar,
+                              parcial, diferenca.removidos['cpf'].tolist() if parcial else [], base)
+    return escritas, diferenca, pendente
+
+def guardar_pedido(pendente, historico=None):
+    """Monta o XML de quem não foi reaproveitado e guarda o pedido como o último do cliente."""
+    historico = historico or HistoricoPedidos()
+    modelo = carregar_modelo(pendente.template_path)
+    trechos = pendente.trechos.copy()
+    with historico.trava, etapa("historico", montadas=int(pendente.montar.sum())) as e:
+        linhas = montar_linhas(pendente.lista[pendente.montar], pendente.config, pendente.cod_pedido, MARCA_CREDITO)
+        por_funcionario = len(PRODUTOS)
+        for i in np.flatnonzero(pendente.montar):
+            molde = montar_trecho([next(linhas) for _ in range(por_funcionario)], modelo.estilos)
+            trechos[i] = zlib.compress(molde.encode("utf-8"), 1)
+        e.linhas = len(pendente.lista)
+        # Outro pedido foi guardado depois da comparação: a diferença não vale mais, troca tudo
+        if pendente.parcial and historico.gerado_em(pendente.cliente) == pendente.base:
+            historico.gravar(pendente.cliente, pendente.assinatura, pendente.lista, trechos, pendente.montar,
+                             pendente.removidos)
+        else:
+            historico.gravar(pendente.cliente, pendente.assinatura, pendente.lista, trechos)
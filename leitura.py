@@ -0,0 +1,384 @@
+import codecs
+import hashlib
+import io
+import re
+import threading
+import zipfile
+from collections import Counter, OrderedDict, namedtuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+
+from cabecalhos import resolver_cabecalho
+from medicao import etapa
+from tratamento import classificar_data, normalizar_lista
+
+# ==========================================
+# LEITURA DA LISTA DE FUNCIONÁRIOS
+# ==========================================
+
+# lista: nome/cpf/nascimento/valor já tratados; colunas: (c_nome, c_cpf, c_nasc, c_valor)
+# datas: Counter de quantas datas de nascimento saíram por cada caminho (ver CAMINHOS_DATA)
+# cabecalho: Resolucao das colunas (None para Word/TXT), confirmada depois que o pedido sai
+Leitura = namedtuple("Leitura", "lista colunas avisos datas cabecalho")
+
+
+def ler_word_txt(nome_arquivo, conteudo):
+    """Lista crua (nome/cpf/nascimento/valor) de um Word/TXT, inteira num DataFrame."""
+    lotes = list(lotes_word_txt(nome_arquivo, conteudo))
+    return pd.concat(lotes, ignore_index=True) if lotes else pd.DataFrame()
+
+def achar_cabecalho(df_topo):
+    """Procura nas primeiras 20 linhas a que tem 'nome' e 'cpf'; devolve o índice e os cabeçalhos."""
+    start_row = 0
+    for i, row in df_topo.head(20).iterrows():
+        l_txt = str(row.values).lower()
+        if 'nome' in l_txt and 'cpf' in l_txt:
+            start_row = i
+            break
+    headers = [str(c).lower().strip() for c in df_topo.iloc[start_row]]
+    return start_row, headers
+
+def escolher_colunas(headers, recarga):
+    """Resolve as colunas pelo índice de sinônimos; devolve (colunas, avisos, resolução)."""
+    avisos = []
+    resolucao = resolver_cabecalho(headers)
+    campos = resolucao.campos
+    c_valor = None
+    if recarga:
+        c_valor = campos['valor']
+        if c_valor is None:
+            avisos.append("⚠️ Coluna 'Valor' não encontrada na planilha.")
+    return (campos['nome'], campos['cpf'], campos['nascimento'], c_valor), avisos, resolucao
+
+def detectar_colunas(df_cli, recarga):
+    """Acha a linha de cabeçalho e as colunas de nome, CPF, nascimento e valor."""
+    start_row, headers = achar_cabecalho(df_cli)
+    data_rows = df_cli.iloc[start_row + 1:].reset_index(drop=True)
+    data_rows.columns = headers
+    colunas, avisos, resolucao = escolher_colunas(headers, recarga)
+    return data_rows, colunas, avisos, resolucao
+
+def _word_txt(nome_arquivo):
+    return nome_arquivo.endswith('.docx') or nome_arquivo.endswith('.txt')
+
+def ler_lista(nome_arquivo, conteudo, recarga):
+    """Lê o arquivo enviado (bytes) e devolve a lista tratada, as colunas usadas e os avisos."""
+    formato = nome_arquivo.rsplit('.', 1)[-1].lower()
+    # --- LEITOR WORD / TXT E EXCEL/CSV GRANDES: EM LOTES ---
+    if _word_txt(nome_arquivo) or len(conteudo) >= LER_EM_LOTES_A_PARTIR_DE:
+        with etapa("leitura_em_lotes", formato=formato, bytes=len(conteudo)) as e:
+            leitura = ler_lista_em_lotes(nome_arquivo, conteudo, recarga)
+            lotes = list(leitura.lista)
+            if not lotes:
+                c_nome, c_cpf, c_nasc, c_valor = leitura.colunas
+                lotes = [normalizar_lista(pd.DataFrame(), c_nome, c_cpf, c_nasc, c_valor if recarga else None)]
+            lista = pd.concat(lotes, ignore_index=True)
+            e.linhas = len(lista)
+        return leitura._replace(lista=lista)
+
+    # --- LEITOR EXCEL/CSV ---
+    with etapa("leitura", formato=formato, bytes=len(conteudo)) as e:
+        if nome_arquivo.endswith('.csv'):
+            df_cli = pd.read_csv(io.BytesIO(conteudo), header=None)
+        else:
+            df_cli = pd.read_excel(io.BytesIO(conteudo), header=None)
+        e.linhas = len(df_cli)
+    with etapa("cabecalho"):
+        data_rows, colunas, avisos, resolucao = detectar_colunas(df_cli, recarga)
+
+    c_nome, c_cpf, c_nasc, c_valor = colunas
+    datas = Counter()
+    with etapa("normalizacao") as e:
+        lista = normalizar_lista(data_rows, c_nome, c_cpf, c_nasc, c_valor if recarga else None,
+                                 contagem_datas=datas)
+        e.linhas = len(lista)
+    return Leitura(lista, colunas, avisos, datas, resolucao)
+
+# ==========================================
+# LEITURA EM LOTES (EXCEL/CSV GRANDES)
+# ==========================================
+# Para exportações de folha com centenas de milhares de linhas, ler tudo com
+# header=None e depois fatiar com iloc ocupa várias vezes o tamanho do
+# arquivo. Aqui o cabeçalho sai das 20 primeiras linhas e o resto é lido em
+# lotes, guardando só as colunas de nome/CPF/nascimento/valor. Os valores
+# recebem as mesmas conversões do pd.read_excel/read_csv, então a lista
+# tratada sai igual à da leitura completa.
+
+LOTE_PADRAO = 20000
+LER_EM_LOTES_A_PARTIR_DE = 20 * 1024 * 1024
+
+
+def _abrir(fonte):
+    # Bytes viram um arquivo novo a cada leitura; caminhos passam direto
+    return io.BytesIO(fonte) if isinstance(fonte, (bytes, bytearray)) else fonte
+
+def _valor_excel(v):
+    # Igual ao leitor openpyxl do pandas: vazio/erro vira NaN e número inteiro vira int
+    if v is None or (isinstance(v, str) and v in ERROR_CODES):
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def _quadro_xlsx(linhas):
+    quadro = pd.DataFrame(linhas, dtype=object)
+    return quadro.mask(quadro.isna(), np.nan)
+
+def _linhas_xlsx(fonte):
+    wb = openpyxl.load_workbook(_abrir(fonte), read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield [_valor_excel(v) for v in row]
+    finally:
+        wb.close()
+
+def _lotes_brutos(nome_arquivo, fonte, tamanho_lote, usecols=None):
+    """Lotes de linhas cruas (DataFrame sem cabeçalho, colunas numeradas) do início do arquivo."""
+    if nome_arquivo.endswith('.csv'):
+        # dtype=str: com a linha de cabeçalho junto, o read_csv completo já deixava tudo como texto
+        yield from pd.read_csv(_abrir(fonte), header=None, dtype=str, usecols=usecols,
+                               chunksize=tamanho_lote)
+    elif nome_arquivo.endswith('.xlsx'):
+        bloco = []
+        for row in _linhas_xlsx(fonte):
+            bloco.append(row)
+            if len(bloco) >= tamanho_lote:
+                yield _quadro_xlsx(bloco)
+                bloco = []
+        if bloco:
+            yield _quadro_xlsx(bloco)
+    else:
+        # .xls (xlrd) não tem leitura incremental
+        yield pd.read_excel(_abrir(fonte), header=None)
+
+def _lotes_das_colunas(nome_arquivo, fonte, pular, indices, nomes, tamanho_lote):
+    vistos = 0
+    for lote in _lotes_brutos(nome_arquivo, fonte, tamanho_lote, usecols=indices):
+        inicio = max(0, pular - vistos)
+        vistos += len(lote)
+        if inicio >= len(lote):
+            continue
+        lote = lote.iloc[inicio:].reindex(columns=indices)
+        lote.columns = nomes
+        yield lote.reset_index(drop=True)
+
+def ler_lista_em_lotes(nome_arquivo, fonte, recarga, tamanho_lote=LOTE_PADRAO):
+    """Leitura incremental de Excel/CSV/Word/TXT: `fonte` são os bytes enviados ou o caminho do arquivo.
+
+    Devolve uma Leitura em que `lista` é um gerador de DataFrames já tratados
+    (nome/cpf/nascimento/valor). `datas` vai sendo preenchido conforme os
+    lotes são consumidos.
+    """
+    if _word_txt(nome_arquivo):
+        colunas = ('nome', 'cpf', 'nascimento', 'valor')
+        avisos = []
+        if recarga:
+            avisos.append("⚠️ Você subiu um Word/TXT para uma Recarga. O sistema não extrai valores soltos de texto. Prefira planilhas (Excel) para Recargas.")
+        datas = Counter()
+        lotes = (normalizar_lista(lote, *colunas[:3], 'valor' if recarga else None, contagem_datas=datas)
+                 for lote in lotes_word_txt(nome_arquivo, fonte, tamanho_lote))
+        return Leitura(lotes, colunas, avisos, datas, None)
+
+    primeiras = _lotes_brutos(nome_arquivo, fonte, 20)
+    topo = next(primeiras, pd.DataFrame()).head(20)
+    primeiras.close()
+    if topo.empty:
+        return Leitura(iter(()), (None, None, None, None), [], Counter(), None)
+    start_row, headers = achar_cabecalho(topo)
+    colunas, avisos, resolucao = escolher_colunas(headers, recarga)
+    c_nome, c_cpf, c_nasc, c_valor = colunas
+    c_valor = c_valor if recarga else None
+
+    # Só as colunas usadas (a primeira, se o nome se repete — como no r.get do laço antigo)
+    nomes = list(dict.fromkeys(c for c in (c_nome, c_cpf, c_nasc, c_valor) if c))
+    indices = [headers.index(c) for c in nomes]
+    datas = Counter()
+
+    def lotes():
+        for lote in _lotes_das_colunas(nome_arquivo, fonte, start_row + 1, indices, nomes, tamanho_lote):
+            yield normalizar_lista(lote, c_nome, c_cpf, c_nasc, c_valor, contagem_datas=datas)
+
+    return Leitura(lotes(), colunas, avisos, datas, resolucao)
+
+# ==========================================
+# LEITURA DE WORD / TXT
+# ==========================================
+# Lista colada em texto: um funcionário é uma linha de nome seguida das linhas
+# de CPF e de datas. O arquivo é percorrido linha a linha (no .docx, parágrafo
+# a parágrafo direto do word/document.xml, sem montar o documento inteiro) e
+# os funcionários vão para colunas que viram um DataFrame a cada lote.
+
+_RE_NAO_DIGITO = re.compile(r'\D')
+_RE_DATA_TEXTO = re.compile(r'\d{2}[/-]\d{2}[/-]\d{2,4}')
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_TEXTO_RUN = {_W + 'tab': '\t', _W + 'ptab': '\t', _W + 'cr': '\n', _W + 'noBreakHyphen': '-'}
+BLOCO_TXT = 1024 * 1024
+
+
+def _texto_paragrafo(p):
+    # Mesmo texto do Paragraph.text do python-docx: runs e hyperlinks diretos do parágrafo
+    partes = []
+    for filho in p:
+        if filho.tag == _W + 'hyperlink':
+            runs = [r for r in filho if r.tag == _W + 'r']
+        elif filho.tag == _W + 'r':
+            runs = [filho]
+        else:
+            continue
+        for r in runs:
+            for e in r:
+                if e.tag == _W + 't':
+                    partes.append(e.text or '')
+                elif e.tag == _W + 'br':
+                    # Quebra de página/coluna não vira texto
+                    if e.get(_W + 'type', 'textWrapping') == 'textWrapping':
+                        partes.append('\n')
+                elif e.tag in _TEXTO_RUN:
+                    partes.append(_TEXTO_RUN[e.tag])
+    return ''.join(partes)
+
+def _linhas_docx(fonte):
+    # Só os parágrafos do corpo, como doc.paragraphs (texto dentro de tabelas fica de fora)
+    with zipfile.ZipFile(_abrir(fonte)) as z, z.open('word/document.xml') as xml:
+        corpo, nivel = None, 0
+        for evento, elem in iterparse(xml, events=('start', 'end')):
+            if evento == 'start':
+                nivel += 1
+                if corpo is None and elem.tag == _W + 'body':
+                    corpo, nivel_corpo = elem, nivel
+                continue
+            nivel -= 1
+            if corpo is not None and nivel == nivel_corpo:
+                if elem.tag == _W + 'p':
+                    yield _texto_paragrafo(elem)
+                corpo.remove(elem)
+
+def _linhas_txt(fonte, tamanho_bloco=BLOCO_TXT):
+    # Decodifica por blocos; o pedaço depois da última quebra passa para o próximo
+    decodificador = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    resto = ''
+    arquivo = _abrir(fonte)
+    with (open(arquivo, 'rb') if isinstance(arquivo, str) else arquivo) as f:
+        while True:
+            bloco = f.read(tamanho_bloco)
+            partes = (resto + decodificador.decode(bloco, final=not bloco)).splitlines(keepends=True)
+            resto = ''
+            # Linha sem quebra ainda, ou terminada em \r (o \n pode estar no próximo bloco)
+            if bloco and partes and (partes[-1].splitlines()[0] == partes[-1] or partes[-1].endswith('\r')):
+                resto = partes.pop()
+            yield from partes
+            if not bloco:
+                return
+
+def _linhas_word_txt(nome_arquivo, fonte):
+    linhas = _linhas_docx(fonte) if nome_arquivo.endswith('.docx') else _linhas_txt(fonte)
+    for linha in linhas:
+        linha = linha.strip()
+        if linha:
+            yield linha
+
+def lotes_word_txt(nome_arquivo, fonte, tamanho_lote=LOTE_PADRAO):
+    """Lotes crus (nome/cpf/nascimento/valor) de um Word/TXT; `fonte` são bytes ou o caminho."""
+    colunas = {'nome': [], 'cpf': [], 'nascimento': []}
+
+    # BUG 5 CORRIGIDO: Lógica do parser Word/TXT reescrita.
+    # O problema original sobrescrevia p_atual['nome'] antes de salvar o funcionário anterior,
+    # e o bloco de salvamento nunca era atingido no momento certo.
+    nome, cpf, datas = '', '', []
+
+    def salvar_atual():
+        """Guarda o funcionário acumulado nas colunas se tiver nome e CPF."""
+        if nome and cpf:
+            validas = [d for d in datas if classificar_data(d)[0] is not None]
+            colunas['nome'].append(nome)
+            colunas['cpf'].append(cpf)
+            colunas['nascimento'].append(validas[0] if validas else "")
+
+    def lote():
+        quadro = pd.DataFrame(colunas)
+        quadro['valor'] = 0
+        for c in colunas.values():
+            c.clear()
+        return quadro
+
+    for l in _linhas_word_txt(nome_arquivo, fonte):
+        m_data = _RE_DATA_TEXTO.search(l)
+
+        if m_data:
+            # É uma data — adiciona ao funcionário atual
+            datas.append(m_data.group())
+        elif 9 <= len(nums := _RE_NAO_DIGITO.sub('', l)) <= 14:
+            # É um CPF/número — atribui ao funcionário atual
+            if not cpf:
+                cpf = nums
+        else:
+            # É um nome — salva o anterior e começa um novo
+            salvar_atual()
+            nome, cpf, datas = l, '', []
+            if len(colunas['nome']) >= tamanho_lote:
+                yield lote()
+
+    # Salva o último funcionário que ficou no buffer
+    salvar_atual()
+    if colunas['nome']:
+        yield lote()
+
+# ==========================================
+# CACHE DAS LISTAS JÁ LIDAS
+# ==========================================
+# O Streamlit reexecuta o script a cada interação. Sem cache, editar o CEP
+# relia e retratava a lista inteira. Guardamos o resultado por hash do
+# conteúdo + tipo de pedido, descartando as menos usadas quando passa do
+# número de entradas ou do limite de memória.
+
+CACHE_MAX_ENTRADAS = 16
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_cache_listas = OrderedDict()
+_trava_cache = threading.Lock()
+
+
+def _tamanho(leitura):
+    return int(leitura.lista.memory_usage(deep=True).sum())
+
+def ler_lista_em_cache(nome_arquivo, conteudo, recarga):
+    """Igual a `ler_lista`, mas reaproveita a leitura de um upload idêntico.
+
+    O resultado é compartilhado entre reexecuções: não altere o DataFrame devolvido.
+    """
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower()
+    chave = (hashlib.sha256(conteudo).hexdigest(), extensao, bool(recarga))
+    with _trava_cache:
+        if chave in _cache_listas:
+            _cache_listas.move_to_end(chave)
+            return _cache_listas[chave][0]
+
+    leitura = ler_lista(nome_arquivo, conteudo, recarga)
+    tamanho = _tamanho(leitura)
+    if tamanho > CACHE_MAX_BYTES:
+        return leitura
+
+    with _trava_cache:
+        _cache_listas[chave] = (leitura, tamanho)
+        _cache_listas.move_to_end(chave)
+        total = sum(t for _, t in _cache_listas.values())
+        while len(_cache_listas) > CACHE_MAX_ENTRADAS or total > CACHE_MAX_BYTES:
+            _, (_, t) = _cache_listas.popitem(last=False)
+            total -= t
+    return leitura
+
+def descartar_lista_em_cache(conteudo):
+    """Esquece as leituras deste upload (ex.: as colunas foram corrigidas e a lista precisa ser relida)."""
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    with _trava_cache:
+        for chave in [c for c in _cache_listas if c[0] == hash_conteudo]:
+            del _cache_listas[chave]
+
+def limpar_cache_listas():
+    with _trava_cache:
+        _cache_listas.clear()
@@ -0,0 +1,178 @@
+"""Geração em lote, sem Streamlit.
+
+Uso:
+    python lote.py PASTA_LISTAS MANIFESTO.json [--saida PASTA] [--workers N] [--timeout SEG]
+
+O manifesto é uma lista JSON, um item por cliente, com os mesmos campos de
+endereço da tela (`config_rh`):
+
+    [
+      {
+        "arquivo": "acme.xlsx",
+        "razao_social": "ACME LTDA",
+        "recarga": true,
+        "config_rh": {"Local de entrega": "MATRIZ", "CEP": "01310918", ...}
+      }
+    ]
+
+No lugar de `config_rh`, um item pode trazer "planilha_antiga": "acme_antigo.xlsx"
+(na mesma pasta das listas): o endereço é tirado desse PLANSIP3C já enviado.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from leitura import ler_lista, ler_lista_em_lotes
+from medicao import etapa
+from planilha import (PRODUTOS, TEMPLATE_PADRAO, gerar_pedido, ler_enderecos_antigos, nome_arquivo_rejeitados,
+                      nome_arquivo_saida)
+from tratamento import separar_rejeitados
+
+TIMEOUT_PADRAO = 300
+
+
+class TempoEsgotado(Exception):
+    pass
+
+
+def _estourou(signum, frame):
+    raise TempoEsgotado()
+
+def gerar_arquivo(caminho_lista, razao_social, recarga, config, pasta_saida,
+                  template_path=TEMPLATE_PADRAO, timeout=None):
+    """Lê uma lista, gera o pedido em `pasta_saida` e devolve um resumo do resultado.
+
+    Roda dentro dos processos do pool. O limite de tempo usa SIGALRM, então só é
+    aplicado onde o sinal existe (Linux/macOS).
+    """
+    inicio = time.perf_counter()
+    resultado = {'arquivo': caminho_lista, 'saida': None, 'funcionarios': 0, 'rejeitados': 0, 'status': 'ok',
+                 'mensagem': ''}
+    limite = bool(timeout) and hasattr(signal, "SIGALRM")
+    parciais = []
+    if limite:
+        signal.signal(signal.SIGALRM, _estourou)
+        signal.alarm(int(timeout))
+    try:
+        nome = os.path.basename(caminho_lista)
+        saida = os.path.join(pasta_saida, nome_arquivo_saida(razao_social, recarga))
+        # Grava com outro nome e só troca no fim: se estourar o tempo ou der erro
+        # no meio, não fica uma planilha cortada com o nome final
+        parcial = saida + ".parcial"
+        parciais.append(parcial)
+        with etapa("pedido_lote", arquivo=nome) as e:
+            if nome.endswith(('.csv', '.xlsx', '.docx', '.txt')):
+                # Lê e grava em lotes: a memória não depende do tamanho da lista
+                leitura = ler_lista_em_lotes(nome, caminho_lista, recarga)
+                lotes = leitura.lista
+            else:
+                with open(caminho_lista, "rb") as f:
+                    leitura = ler_lista(nome, f.read(), recarga)
+                lotes = [leitura.lista]
+            # CPFs inválidos/repetidos ficam fora e vão para o relatório ao lado da planilha
+            vistos, rejeitados = set(), []
+
+            def aceitos():
+                for lote in lotes:
+                    ok, recusados = separar_rejeitados(lote, vistos)
+                    rejeitados.append(recusados)
+                    yield ok
+
+            linhas = gerar_pedido(template_path, aceitos(), config, recarga, parcial)
+            funcionarios = linhas // len(PRODUTOS)
+            e.linhas = funcionarios
+        rejeitados = pd.concat(rejeitados, ignore_index=True) if rejeitados else pd.DataFrame()
+        if len(rejeitados):
+            relatorio = os.path.join(pasta_saida, nome_arquivo_rejeitados(razao_social, recarga))
+            parciais.append(relatorio + ".parcial")
+            rejeitados.to_csv(parciais[-1], index=False, sep=';', encoding='utf-8-sig')
+            os.replace(parciais[-1], relatorio)
+            resultado['relatorio_rejeitados'] = relatorio
+        os.replace(parcial, saida)
+        resultado.update(saida=saida, funcionarios=funcionarios, rejeitados=len(rejeitados),
+                         mensagem=" ".join(leitura.avisos))
+    except TempoEsgotado:
+        resultado.update(status='tempo esgotado', mensagem=f"Passou de {timeout}s")
+    except Exception as e:
+        resultado.update(status='erro', mensagem=str(e))
+    finally:
+        if limite:
+            signal.alarm(0)
+        for caminho in parciais:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+def ler_manifesto(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        itens = json.load(f)
+    for item in itens:
+        if 'arquivo' not in item or ('config_rh' not in item and 'planilha_antiga' not in item):
+            raise ValueError(f"Item do manifesto sem 'arquivo' ou 'config_rh'/'planilha_antiga': {item}")
+    return itens
+
+def completar_enderecos(pasta_listas, itens):
+    """Preenche o `config_rh` dos itens que apontam para uma planilha antiga, lendo cada uma uma vez só."""
+    pendentes = [item for item in itens if 'config_rh' not in item]
+    caminhos = {os.path.join(pasta_listas, item['planilha_antiga']) for item in pendentes}
+    enderecos, falhas = ler_enderecos_antigos(sorted(caminhos))
+    if falhas:
+        raise ValueError("Planilhas antigas ilegíveis: " + "; ".join(f"{c} ({e})" for c, e in falhas.items()))
+    for item in pendentes:
+        item['config_rh'] = enderecos[os.path.join(pasta_listas, item['planilha_antiga'])]
+    return itens
+
+def gerar_lote(pasta_listas, itens, pasta_saida, workers=None, timeout=TIMEOUT_PADRAO,
+               template_path=TEMPLATE_PADRAO):
+    """Gera todos os pedidos do manifesto em paralelo e devolve os resumos na ordem do manifesto."""
+    os.makedirs(pasta_saida, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(itens) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [
+            pool.submit(
+                gerar_arquivo,
+                os.path.join(pasta_listas, item['arquivo']),
+                item.get('razao_social') or os.path.splitext(item['arquivo'])[0],
+                bool(item.get('recarga', False)),
+                item['config_rh'],
+                pasta_saida,
+                template_path,
+                timeout,
+            )
+            for item in itens
+        ]
+        return [f.result() for f in futuros]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Gera as planilhas PLANSIP3C/RECARGA de vários clientes de uma vez.")
+    ap.add_argument("pasta_listas", help="Pasta com as listas de funcionários dos clientes")
+    ap.add_argument("manifesto",
+                    help="JSON com arquivo, razão social, tipo e endereço (ou planilha antiga) de cada cliente")
+    ap.add_argument("--saida", default="saida", help="Pasta onde as planilhas serão gravadas (padrão: ./saida)")
+    ap.add_argument("--workers", type=int, default=None, help="Processos em paralelo (padrão: núcleos da máquina)")
+    ap.add_argument("--timeout", type=int, default=TIMEOUT_PADRAO, help="Limite por arquivo, em segundos")
+    ap.add_argument("--template", default=TEMPLATE_PADRAO, help="Modelo PLANSIP3C a usar")
+    args = ap.parse_args(argv)
+
+    itens = completar_enderecos(args.pasta_listas, ler_manifesto(args.manifesto))
+    resultados = gerar_lote(args.pasta_listas, itens, args.saida, args.workers, args.timeout, args.template)
+    falhas = 0
+    for r in resultados:
+        if r['status'] != 'ok':
+            falhas += 1
+        recusados = f", {r['rejeitados']} CPFs recusados" if r['rejeitados'] else ""
+        print(f"[{r['status']}] {r['arquivo']} -> {r['saida'] or '-'} "
+              f"({r['funcionarios']} funcionários{recusados}, {r['segundos']}s) {r['mensagem']}".rstrip())
+    print(f"{len(resultados) - falhas}/{len(resultados)} pedidos gerados.")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# ==========================================
+# MEDIÇÃO DAS ETAPAS DO PEDIDO
+# ==========================================
+# `with etapa("leitura") as e:` marca um trecho do fluxo; ao sair, grava tempo,
+# linhas (e.linhas = ...) e pico de memória. Desligado, `etapa` devolve um
+# objeto vazio compartilhado e não mede nada. Liga de duas formas:
+#   - PLUXEE_MEDICAO=1: toda etapa vira uma linha JSON no logger "pluxee.medicao"
+#     (PLUXEE_MEDICAO_MEMORIA=1 inclui o pico de memória, via tracemalloc);
+#   - `with coletar() as registros:`: só nesta thread (uma sessão do Streamlit),
+#     guardando os registros para o painel da barra lateral.
+# O pico de memória é o que a etapa alocou acima do que já estava em uso, medido
+# pelo tracemalloc. Com várias sessões ao mesmo tempo ele mistura as alocações
+# das outras threads, então vale como ordem de grandeza.
+
+LOGGER = logging.getLogger("pluxee.medicao")
+LOG_ATIVO = os.environ.get("PLUXEE_MEDICAO", "") not in ("", "0")
+MEMORIA_NO_LOG = os.environ.get("PLUXEE_MEDICAO_MEMORIA", "") not in ("", "0")
+
+
+class _PorThread(threading.local):
+    # Padrões na classe: procurar atributo que falta no threading.local custa uma exceção
+    coletores = ()
+    pilha = None
+
+
+_local = _PorThread()
+_trava_memoria = threading.Lock()
+_usos_memoria = 0
+_ligamos_tracemalloc = False
+
+if LOG_ATIVO and not LOGGER.handlers:
+    _saida = logging.StreamHandler()
+    _saida.setFormatter(logging.Formatter("%(message)s"))
+    LOGGER.addHandler(_saida)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+
+
+class _EtapaNula:
+    """Usada quando a medição está desligada: entra, sai e aceita `linhas` sem fazer nada."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, nome, valor):
+        pass
+
+
+_NULA = _EtapaNula()
+
+
+class _Etapa:
+    __slots__ = ("nome", "linhas", "extras", "_inicio", "_memoria", "_base", "_pico_filhas")
+
+    def __init__(self, nome, linhas, extras):
+        self.nome = nome
+        self.linhas = linhas
+        self.extras = extras
+
+    def __enter__(self):
+        pilha = _pilha()
+        self._memoria = tracemalloc.is_tracing()
+        self._pico_filhas = 0
+        if self._memoria:
+            atual, pico = tracemalloc.get_traced_memory()
+            if pilha:
+                # O reset abaixo apaga o pico da etapa de fora; guardamos antes
+                pilha[-1]._pico_filhas = max(pilha[-1]._pico_filhas, pico)
+            tracemalloc.reset_peak()
+            self._base = atual
+        pilha.append(self)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, exc, tb):
+        segundos = time.perf_counter() - self._inicio
+        pilha = _pilha()
+        pilha.pop()
+        registro = {'etapa': self.nome, 'segundos': round(segundos, 6), 'linhas': self.linhas}
+        if self._memoria and tracemalloc.is_tracing():
+            pico = max(tracemalloc.get_traced_memory()[1], self._pico_filhas)
+            registro['pico_mb'] = round(max(pico - self._base, 0) / 2 ** 20, 3)
+            if pilha:
+                pilha[-1]._pico_filhas = max(pilha[-1]._pico_filhas, pico)
+        if tipo is not None:
+            registro['erro'] = tipo.__name__
+        registro.update(self.extras)
+        _registrar(registro)
+        return False
+
+
+def _pilha():
+    pilha = _local.pilha
+    if pilha is None:
+        pilha = _local.pilha = []
+    return pilha
+
+def _registrar(registro):
+    for registros in _local.coletores:
+        registros.append(registro)
+    if LOG_ATIVO:
+        LOGGER.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+def etapa(nome, linhas=None, **extras):
+    """Context manager que mede um trecho; `extras` entram no registro (ex.: arquivo=...)."""
+    if not LOG_ATIVO and not _local.coletores:
+        return _NULA
+    return _Etapa(nome, linhas, extras)
+
+def medido(nome=None):
+    """Decorador: mede cada chamada da função como uma etapa (nome padrão: o da função)."""
+    def decorar(funcao):
+        rotulo = nome or funcao.__name__
+
+        @wraps(funcao)
+        def medida(*args, **kwargs):
+            if not LOG_ATIVO and not _local.coletores:
+                return funcao(*args, **kwargs)
+            with _Etapa(rotulo, None, {}):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorar
+
+def _ligar_memoria():
+    global _usos_memoria, _ligamos_tracemalloc
+    with _trava_memoria:
+        if _usos_memoria == 0:
+            # Se alguém de fora já ligou o tracemalloc, não é nosso para desligar
+            _ligamos_tracemalloc = not tracemalloc.is_tracing()
+            if _ligamos_tracemalloc:
+                tracemalloc.start()
+        _usos_memoria += 1
+
+def _desligar_memoria():
+    global _usos_memoria
+    with _trava_memoria:
+        _usos_memoria -= 1
+        if _usos_memoria == 0 and _ligamos_tracemalloc:
+            tracemalloc.stop()
+
+@contextmanager
+def coletar(memoria=True):
+    """Liga a medição nesta thread e devolve a lista onde os registros vão entrando.
+
+    Com `memoria`, o tracemalloc fica ligado enquanto durar (deixa o código
+    visivelmente mais lento; serve para diagnóstico, não para o dia a dia).
+    """
+    registros = []
+    coletores = _local.coletores
+    if not coletores:
+        coletores = _local.coletores = []
+    coletores.append(registros)
+    if memoria:
+        _ligar_memoria()
+    try:
+        yield registros
+    finally:
+        if memoria:
+            _desligar_memoria()
+        coletores.pop()
+
+
+if LOG_ATIVO and MEMORIA_NO_LOG:
+    _ligar_memoria()
@@ -0,0 +1,419 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.cell.text import Text
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from openpyxl.worksheet._reader import _cast_number
+
+from medicao import etapa, medido
+
+# ==========================================
+# ESCRITA DA PLANILHA PLANSIP3C
+# ==========================================
+# A planilha final é o próprio PLANSIP3C_NOVA.xlsx com as linhas da aba de
+# beneficiários trocadas. Em vez de carregar tudo no openpyxl, copiamos o zip
+# do modelo parte a parte e só reescrevemos o XML dessa aba, gravando as linhas
+# direto no arquivo de saída. Estilos, validações, comentários e as outras
+# abas saem byte a byte iguais ao modelo, e a memória não cresce com a lista.
+
+TEMPLATE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PLANSIP3C_NOVA.xlsx")
+ABA_BENEFICIARIOS = "Dados dos Beneficiários"
+PRIMEIRA_LINHA = 8
+TOTAL_COLUNAS = 30
+COD_RECARGA = "001 - Pedido Normal"
+COD_PRIMEIRA_VIA = "023 - Pedido de 1ªVia de Cartão Sem Crédito"
+PRODUTOS = ["6001 - Carteira Refeição", "6002 - Carteira Alimentação"]
+LINHAS_POR_BLOCO = 1000
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_LETRAS = [get_column_letter(c) for c in range(1, TOTAL_COLUNAS + 1)]
+
+
+def endereco_pedido(config):
+    """Colunas P..AC (entrega e responsável), iguais em todas as linhas do pedido."""
+    cep_limpo = re.sub(r'\D', '', str(config.get('CEP', '')))
+    # BUG 6 CORRIGIDO: Coluna 21 (Referência) estava sendo pulada completamente
+    return [
+        config.get('Local de entrega'), cep_limpo, config.get('Endereço'),
+        config.get('Número'), config.get('Complemento'), config.get('Referência', ''),
+        config.get('Bairro'), config.get('Cidade'), config.get('UF', 'SP'),
+        config.get('Responsável'), config.get('DDD'), config.get('Telefone'),
+        config.get('Email'), config.get('Porta_a_Porta'),
+    ]
+
+def montar_linhas(lista, config, cod_pedido, dt_cred):
+    """Gera os valores (colunas A..AC) de cada linha: uma por produto para cada funcionário.
+
+    `lista` é o DataFrame tratado ou um iterável de DataFrames (leitura em lotes).
+    """
+    endereco = endereco_pedido(config)
+    lotes = [lista] if hasattr(lista, "itertuples") else lista
+    for lote in lotes:
+        for nf, cpfl, nasc, valor_final in lote.itertuples(index=False, name=None):
+            for p_code in PRODUTOS:
+                yield [None, "Ativo", nf, cpfl, nasc, nf, None, None, None, None,
+                       cod_pedido, p_code, valor_final, dt_cred, None] + endereco
+
+def _caminho_aba(zf, nome_aba):
+    wb = ET.fromstring(zf.read("xl/workbook.xml"))
+    rid = None
+    for aba in wb.iter(f"{{{_NS_MAIN}}}sheet"):
+        if aba.get("name") == nome_aba:
+            rid = aba.get(f"{{{_NS_REL}}}id")
+    if rid is None:
+        raise KeyError(f"Aba '{nome_aba}' não encontrada no modelo.")
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    alvo = next(r.get("Target") for r in rels if r.get("Id") == rid)
+    return alvo.lstrip("/") if alvo.startswith("/") else "xl/" + alvo
+
+def dividir_aba(xml, primeira_linha=PRIMEIRA_LINHA):
+    """Separa o XML da aba em cabeçalho, linhas-modelo (a partir da primeira linha de dados) e rodapé.
+
+    Devolve também o estilo (`s`) de cada coluna na primeira linha de dados,
+    que é reaplicado em todas as linhas geradas.
+    """
+    fim = xml.index("</sheetData>")
+    m = re.search(rf'<row r="{primeira_linha}"[ >]', xml)
+    inicio = m.start() if m else fim
+    cabecalho = xml[:inicio]
+    # A dimensão muda com o tamanho da lista e é opcional: o Excel recalcula ao abrir
+    cabecalho = re.sub(r'<dimension ref="[^"]*"/>', '', cabecalho)
+    linhas_modelo = [
+        (int(num), texto)
+        for texto, num in re.findall(r'(<row r="(\d+)".*?</row>)', xml[inicio:fim], re.S)
+    ]
+    estilos = {}
+    if linhas_modelo:
+        for letra, estilo in re.findall(r'<c r="([A-Z]+)\d+"(?: s="(\d+)")?', linhas_modelo[0][1]):
+            estilos[letra] = estilo
+    return cabecalho, linhas_modelo, xml[fim:], estilos
+
+@lru_cache(maxsize=8192, typed=True)
+def _celula(estilo, valor):
+    """Corpo da célula depois da referência (`<c r="A8"` fica por conta de `_linha`)."""
+    s = f' s="{estilo}"' if estilo else ''
+    if valor is None or valor == "" or (isinstance(valor, float) and valor != valor):
+        return f'"{s}/>'
+    if isinstance(valor, bool):
+        return f'"{s} t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'"{s}><v>{valor!r}</v></c>'
+    texto = escape(ILLEGAL_CHARACTERS_RE.sub('', str(valor)))
+    espaco = ' xml:space="preserve"' if texto != texto.strip() else ''
+    return f'"{s} t="inlineStr"><is><t{espaco}>{texto}</t></is></c>'
+
+def limpar_cache_celulas():
+    _celula.cache_clear()
+
+def _linha(num, valores, estilos):
+    # Endereço, produto e tipo de pedido se repetem em todas as linhas: o cache
+    # de `_celula` evita reescapar o mesmo texto milhares de vezes
+    celulas = [f'<row r="{num}" spans="1:{TOTAL_COLUNAS}">']
+    for i, letra in enumerate(_LETRAS):
+        valor = valores[i] if i < len(valores) else None
+        celulas.append(f'<c r="{letra}{num}')
+        celulas.append(_celula(estilos.get(letra), valor))
+    celulas.append('</row>')
+    return "".join(celulas)
+
+# Trechos já montados (histórico de pedidos): o XML das linhas de um funcionário
+# guardado como molde de str.format, com {0}, {1}... no lugar dos números das
+# linhas e {credito} no da data de crédito, que mudam de um pedido para o outro.
+# Os marcadores usados na montagem são caracteres de uso privado: não são
+# escapados nem removidos como ilegais, e não aparecem em listas de RH.
+MARCAS_LINHA = [chr(0xE000 + i) for i in range(len(PRODUTOS))]
+MARCA_CREDITO = "\uE0FF"
+
+
+def montar_trecho(linhas, estilos):
+    """Molde das linhas de um funcionário; `linhas` vêm de `montar_linhas` com dt_cred=MARCA_CREDITO."""
+    xml = "".join(_linha(MARCAS_LINHA[i], valores, estilos) for i, valores in enumerate(linhas))
+    if "{" in xml or "}" in xml:
+        xml = xml.replace("{", "{{").replace("}", "}}")
+    for i in range(len(linhas)):
+        xml = xml.replace(MARCAS_LINHA[i], "{%d}" % i)
+    return xml.replace(MARCA_CREDITO, "{credito}")
+
+# ==========================================
+# CACHE DO MODELO
+# ==========================================
+# O modelo é lido e dividido uma vez por processo e compartilhado entre todas
+# as sessões. Das partes do zip guardamos só dados simples (nome, data,
+# compressão, atributos e conteúdo): o ZipInfo passado ao writestr é alterado
+# pelo zipfile (offset, CRC, tamanhos), então cada gravação monta o seu. Se o
+# arquivo mudar no disco (mtime/tamanho diferentes e conteúdo com outro hash),
+# é relido no próximo pedido.
+
+Modelo = namedtuple("Modelo", "assinatura hash partes caminho cabecalho linhas_modelo rodape estilos")
+# conteudo None: é a aba de beneficiários, montada na hora
+Parte = namedtuple("Parte", "nome date_time compress_type external_attr conteudo")
+
+_modelos = {}
+_trava_modelos = threading.Lock()
+
+
+def _ler_modelo(template_path, assinatura, hash_arquivo, primeira_linha):
+    with zipfile.ZipFile(template_path) as modelo:
+        caminho = _caminho_aba(modelo, ABA_BENEFICIARIOS)
+        partes = tuple(Parte(item.filename, item.date_time, item.compress_type, item.external_attr,
+                             None if item.filename == caminho else modelo.read(item.filename))
+                       for item in modelo.infolist())
+        cabecalho, linhas_modelo, rodape, estilos = dividir_aba(
+            modelo.read(caminho).decode("utf-8"), primeira_linha
+        )
+    return Modelo(assinatura, hash_arquivo, partes, caminho, cabecalho.encode("utf-8"),
+                  linhas_modelo, rodape.encode("utf-8"), estilos)
+
+@medido("modelo")
+def carregar_modelo(template_path, primeira_linha=PRIMEIRA_LINHA):
+    """Devolve o modelo já dividido, relendo do disco só quando o arquivo mudou."""
+    chave = (os.path.abspath(template_path), primeira_linha)
+    info = os.stat(template_path)
+    assinatura = (info.st_mtime_ns, info.st_size)
+    with _trava_modelos:
+        atual = _modelos.get(chave)
+        if atual is not None and atual.assinatura == assinatura:
+            return atual
+        with open(template_path, "rb") as f:
+            hash_arquivo = hashlib.sha256(f.read()).hexdigest()
+        if atual is not None and atual.hash == hash_arquivo:
+            # Arquivo só foi "tocado" (cópia, checkout): conteúdo igual, reaproveita
+            atual = atual._replace(assinatura=assinatura)
+        else:
+            atual = _ler_modelo(template_path, assinatura, hash_arquivo, primeira_linha)
+        _modelos[chave] = atual
+        return atual
+
+def escrever_planilha(template_path, linhas, destino, primeira_linha=PRIMEIRA_LINHA):
+    """Grava em `destino` (caminho ou arquivo binário) o modelo com `linhas` na aba de beneficiários.
+
+    Cada item de `linhas` é a lista de valores de uma linha ou um trecho já
+    montado `(molde, quantidade de linhas, campos)`, com o molde vindo de
+    `montar_trecho` e `campos` completando o str.format (ex.: credito).
+    Devolve o número de linhas escritas.
+    """
+    modelo = carregar_modelo(template_path, primeira_linha)
+    r_idx = primeira_linha
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as saida:
+        for parte in modelo.partes:
+            # ZipInfo novo a cada gravação: o zipfile escreve nele
+            info = zipfile.ZipInfo(parte.nome, date_time=parte.date_time)
+            info.external_attr = parte.external_attr
+            if parte.conteudo is not None:
+                info.compress_type = parte.compress_type
+                saida.writestr(info, parte.conteudo)
+                continue
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with saida.open(info, "w", force_zip64=True) as f:
+                f.write(modelo.cabecalho)
+                bloco = []
+                for valores in linhas:
+                    if isinstance(valores, tuple):
+                        molde, quantas, campos = valores
+                        bloco.append(molde.format(*range(r_idx, r_idx + quantas), **campos))
+                        r_idx += quantas
+                    else:
+                        bloco.append(_linha(r_idx, valores, modelo.estilos))
+                        r_idx += 1
+                    if len(bloco) >= LINHAS_POR_BLOCO:
+                        f.write("".join(bloco).encode("utf-8"))
+                        bloco = []
+                # Linhas formatadas do modelo que sobraram depois dos dados
+                bloco.extend(texto for num, texto in modelo.linhas_modelo if num >= r_idx)
+                f.write("".join(bloco).encode("utf-8"))
+                f.write(modelo.rodape)
+    return r_idx - primeira_linha
+
+def nome_arquivo_saida(razao_social, recarga):
+    prefixo = "RECARGA" if recarga else "PLANSIP3C"
+    return f"{prefixo}_{re.sub(r'[^A-Za-z0-9]', '', razao_social)}.xlsx"
+
+def nome_arquivo_rejeitados(razao_social, recarga):
+    """Relatório dos CPFs que ficaram fora do pedido, ao lado da planilha."""
+    return nome_arquivo_saida(razao_social, recarga)[:-len(".xlsx")] + "_rejeitados.csv"
+
+def gerar_pedido(template_path, lista, config, recarga, destino, dt_cred=None):
+    """Monta o pedido completo (1ª via ou recarga) para a lista já tratada e grava em `destino`."""
+    if dt_cred is None:
+        dt_cred = (datetime.now() + relativedelta(months=1)).strftime('%d/%m/%Y')
+    cod_pedido = COD_RECARGA if recarga else COD_PRIMEIRA_VIA
+    # As linhas são montadas conforme são gravadas, então a etapa cobre as duas coisas
+    with etapa("gravacao", recarga=bool(recarga)) as e:
+        linhas = escrever_planilha(template_path, montar_linhas(lista, config, cod_pedido, dt_cred), destino)
+        e.linhas = linhas
+    return linhas
+
+# ==========================================
+# ENDEREÇO DE UMA PLANILHA ANTIGA
+# ==========================================
+# Um PLANSIP3C já enviado traz o endereço de entrega na primeira linha de
+# beneficiários (colunas P a AC). O load_workbook completo lia todas as linhas,
+# estilos e a tabela de textos compartilhados só para usar 14 células. Aqui a
+# aba é lida em streaming até essa linha e, da tabela de textos, só até o
+# maior índice usado. Os valores saem como o openpyxl com data_only=True os
+# entregaria (número, data, booleano ou texto).
+
+COLUNAS_ENDERECO_ANTIGO = range(16, 30)
+ENDERECOS_ANTIGOS_MAX = 64
+
+_TAG_LINHA = f"{{{_NS_MAIN}}}row"
+_TAG_CELULA = f"{{{_NS_MAIN}}}c"
+_TAG_VALOR = f"{{{_NS_MAIN}}}v"
+_TAG_INLINE = f"{{{_NS_MAIN}}}is"
+_TAG_TEXTO = f"{{{_NS_MAIN}}}si"
+
+_enderecos_antigos = OrderedDict()
+_trava_enderecos = threading.Lock()
+
+
+def _parte_do_livro(zf, tipo):
+    # Caminho da parte do livro (sharedStrings, styles...) pelo tipo da relação
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    for r in rels:
+        if r.get("Type", "").endswith("/" + tipo):
+            alvo = r.get("Target")
+            return alvo.lstrip("/") if alvo.startswith("/") else "xl/" + alvo
+    return None
+
+def _celulas_da_linha(zf, caminho, linha, colunas):
+    """Elementos <c> das `colunas` da `linha`, parando de ler a aba assim que ela passa."""
+    celulas = {}
+    num_linha = 0
+    with zf.open(caminho) as aba:
+        for _, el in ET.iterparse(aba):
+            if el.tag != _TAG_LINHA:
+                continue
+            num_linha = int(el.get("r") or num_linha + 1)
+            if num_linha == linha:
+                coluna = 0
+                for c in el.iter(_TAG_CELULA):
+                    ref = c.get("r")
+                    coluna = coordinate_to_tuple(ref)[1] if ref else coluna + 1
+                    if coluna in colunas:
+                        celulas[coluna] = c
+            if num_linha >= linha:
+                break
+            el.clear()
+    return celulas
+
+def _textos_compartilhados(zf, indices):
+    caminho = _parte_do_livro(zf, "sharedStrings")
+    textos = {}
+    if not indices or caminho is None:
+        return textos
+    ultimo = max(indices)
+    with zf.open(caminho) as f:
+        for i, (_, el) in enumerate(e for e in ET.iterparse(f) if e[1].tag == _TAG_TEXTO):
+            if i in indices:
+                textos[i] = Text.from_tree(el).content.replace("x005F_", "")
+            el.clear()
+            if i >= ultimo:
+                break
+    return textos
+
+def _valores_da_linha(zf, linha, colunas):
+    """{coluna: valor} da linha da aba de beneficiários, como no openpyxl com data_only=True."""
+    celulas = _celulas_da_linha(zf, _caminho_aba(zf, ABA_BENEFICIARIOS), linha, colunas)
+    textos = _textos_compartilhados(zf, {int(c.findtext(_TAG_VALOR)) for c in celulas.values()
+                                         if c.get("t") == "s" and c.findtext(_TAG_VALOR)})
+    estilos = None
+    valores = {}
+    for coluna, c in celulas.items():
+        tipo = c.get("t", "n")
+        if tipo == "inlineStr":
+            filho = c.find(_TAG_INLINE)
+            valores[coluna] = Text.from_tree(filho).content if filho is not None else None
+            continue
+        valor = c.findtext(_TAG_VALOR) or None
+        if valor is not None:
+            if tipo == "n":
+                valor = _cast_number(valor)
+                estilo = int(c.get("s") or 0)
+                if estilo:
+                    # Número com formato de data vira data; os estilos só são lidos se precisar
+                    if estilos is None:
+                        estilos = Stylesheet.from_tree(ET.fromstring(zf.read("xl/styles.xml")))
+                        pr = ET.fromstring(zf.read("xl/workbook.xml")).find(f"{{{_NS_MAIN}}}workbookPr")
+                        epoca = (CALENDAR_MAC_1904 if pr is not None and pr.get("date1904") in ("1", "true")
+                                 else CALENDAR_WINDOWS_1900)
+                    if estilo in estilos.date_formats:
+                        try:
+                            valor = from_excel(valor, epoca, timedelta=estilo in estilos.timedelta_formats)
+                        except (OverflowError, ValueError):
+                            valor = "#VALUE!"
+            elif tipo == "s":
+                valor = textos[int(valor)]
+            elif tipo == "b":
+                valor = bool(int(valor))
+            elif tipo == "d":
+                valor = from_ISO8601(valor)
+        valores[coluna] = valor
+    return valores
+
+def _endereco_das_celulas(valores):
+    def campo(coluna, padrao=""):
+        return str(valores.get(coluna) or padrao).replace('None', '')
+
+    return {
+        'Local de entrega': campo(16, "MATRIZ"),
+        'CEP': campo(17),
+        'Endereço': campo(18),
+        'Número': campo(19),
+        'Complemento': campo(20),
+        'Bairro': campo(22)[:30],
+        'Cidade': campo(23)[:30],
+        'UF': campo(24, "SP")[:2].upper(),
+        'Responsável': campo(25),
+        'DDD': campo(26)[:2],
+        'Telefone': campo(27),
+        'Email': campo(28),
+        'Porta_a_Porta': str(valores.get(29) or "Não").replace('None', 'Não'),
+    }
+
+@medido("endereco_antigo")
+def ler_endereco_antigo(conteudo, linha=PRIMEIRA_LINHA):
+    """Endereço de entrega (no formato do config_rh) de um PLANSIP3C já preenchido.
+
+    Guardado por hash do arquivo: subir a mesma planilha de novo não relê nada.
+    """
+    chave = (hashlib.sha256(conteudo).hexdigest(), linha)
+    with _trava_enderecos:
+        if chave in _enderecos_antigos:
+            _enderecos_antigos.move_to_end(chave)
+            return dict(_enderecos_antigos[chave])
+
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        endereco = _endereco_das_celulas(_valores_da_linha(zf, linha, COLUNAS_ENDERECO_ANTIGO))
+
+    with _trava_enderecos:
+        _enderecos_antigos[chave] = endereco
+        while len(_enderecos_antigos) > ENDERECOS_ANTIGOS_MAX:
+            _enderecos_antigos.popitem(last=False)
+    return dict(endereco)
+
+def ler_enderecos_antigos(caminhos):
+    """Endereço de várias planilhas antigas de uma vez: ({caminho: endereço}, {caminho: erro})."""
+    enderecos, falhas = {}, {}
+    for caminho in caminhos:
+        try:
+            with open(caminho, "rb") as f:
+                enderecos[caminho] = ler_endereco_antigo(f.read())
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile, ET.ParseError) as e:
+            falhas[caminho] = str(e) or type(e).__name__
+    return enderecos, falhas
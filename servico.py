@@ -0,0 +1,445 @@
+"""Serviço local de geração de pedidos (HTTP sobre asyncio), opcional.
+
+Uso:
+    python servico.py [--host 127.0.0.1] [--porta 8765] [--workers N] [--fila 8] [--timeout SEG]
+
+A tela do Streamlit manda os pedidos para cá quando PLUXEE_SERVICO_URL está
+definida (ex.: http://127.0.0.1:8765). A geração roda num pool de processos
+com tamanho fixo; com todos os processos ocupados e a fila cheia, novos
+pedidos recebem 429 e tentam de novo depois.
+
+Rotas:
+    POST   /pedidos                  JSON: arquivo, conteudo_base64, recarga, razao_social, config_rh
+                                     -> 202 {"id": ..., "status": "na fila", ...}
+    GET    /pedidos/ID               situação do pedido
+    GET    /pedidos/ID/progresso     uma linha JSON por mudança, até terminar (chunked)
+    GET    /pedidos/ID/arquivo       XLSX gerado (409 se ainda não terminou)
+    GET    /pedidos/ID/rejeitados    CSV dos CPFs que ficaram fora
+    DELETE /pedidos/ID               descarta o pedido: se ainda está na fila, não chega a rodar; se já
+                                     está gerando, o processo vai até o fim (ou o --timeout) e o
+                                     resultado é jogado fora (a recarga não entra no histórico)
+    GET    /saude                    workers, ocupação e tamanho da fila
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import requests
+
+from historico import HISTORICO_DB_PATH, HistoricoPedidos, gerar_pedido_incremental, guardar_pedido, prefixo_cliente
+from leitura import ler_lista
+from lote import TIMEOUT_PADRAO, TempoEsgotado, _estourou
+from planilha import TEMPLATE_PADRAO, gerar_pedido
+from tratamento import separar_rejeitados
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+FILA_PADRAO = 8
+TAMANHO_MAX = 200 * 1024 * 1024  # corpo do POST (lista em base64)
+PEDIDOS_GUARDADOS = 32  # terminados que ficam disponíveis para download
+PARTE_PROGRESSO = 2000  # funcionários entre dois avisos de progresso
+TERMINADOS = ('pronto', 'erro', 'cancelado')
+
+
+class ErroHttp(Exception):
+    def __init__(self, status, mensagem=""):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem or HTTPStatus(status).phrase
+
+
+# ==========================================
+# GERAÇÃO (DENTRO DOS PROCESSOS DO POOL)
+# ==========================================
+
+def _em_partes(lista, avisar):
+    # O gerar_pedido consome a parte seguinte só depois de gravar a anterior
+    for inicio in range(0, len(lista), PARTE_PROGRESSO):
+        yield lista.iloc[inicio:inicio + PARTE_PROGRESSO]
+        avisar(feitos=min(inicio + PARTE_PROGRESSO, len(lista)))
+
+def executar_pedido(id_pedido, nome, conteudo, recarga, razao_social, config, template_path, progresso, timeout,
+                    historico_path=HISTORICO_DB_PATH):
+    """Lê, valida e gera um pedido; os avisos de progresso vão para a fila `progresso`.
+
+    Devolve (xlsx, csv dos rejeitados, recarga para o histórico ou None). O
+    histórico não é gravado aqui: só quando o pedido termina como pronto.
+    """
+    def avisar(**dados):
+        progresso.put((id_pedido, dados))
+
+    limite = bool(timeout) and hasattr(signal, "SIGALRM")
+    if limite:
+        signal.signal(signal.SIGALRM, _estourou)
+        signal.alarm(int(timeout))
+    try:
+        avisar(status='lendo')
+        leitura = ler_lista(nome, conteudo, recarga)
+        lista, rejeitados = separar_rejeitados(leitura.lista)
+        avisar(status='gerando', total=len(lista), rejeitados=len(rejeitados), avisos=leitura.avisos)
+        buf = io.BytesIO()
+        cliente = prefixo_cliente(razao_social, recarga)
+        pendente = None
+        if recarga and cliente:
+            # Mesmo caminho da tela: reaproveita a última recarga do cliente
+            _, _, pendente = gerar_pedido_incremental(template_path, lista, config, recarga, buf, cliente,
+                                                      HistoricoPedidos(historico_path),
+                                                      progresso=lambda feitos: avisar(feitos=feitos))
+        else:
+            gerar_pedido(template_path, _em_partes(lista, avisar), config, recarga, buf)
+        return buf.getvalue(), rejeitados.to_csv(index=False, sep=';').encode('utf-8-sig'), pendente
+    finally:
+        if limite:
+            signal.alarm(0)
+
+def guardar_historico(pendente, historico_path=HISTORICO_DB_PATH):
+    guardar_pedido(pendente, HistoricoPedidos(historico_path))
+
+# ==========================================
+# FILA E ESTADO DOS PEDIDOS
+# ==========================================
+
+class Pedido:
+    def __init__(self, id_pedido, arquivo, razao_social, recarga):
+        self.id = id_pedido
+        self.arquivo = arquivo
+        self.razao_social = razao_social
+        self.recarga = recarga
+        self.estado = {'id': id_pedido, 'status': 'na fila', 'arquivo': arquivo, 'total': None, 'feitos': 0,
+                       'rejeitados': 0, 'avisos': [], 'mensagem': '', 'criado_em': time.time()}
+        self.xlsx = None
+        self.csv_rejeitados = None
+        self.tarefa = None
+        self.gerando = False  # já tem um processo do pool trabalhando nele
+        self.mudou = asyncio.Event()
+
+    def terminar(self, **dados):
+        # Pedido descartado no meio não volta a mudar de situação
+        if not self.terminado:
+            self.atualizar(**dados)
+
+    def atualizar(self, **dados):
+        self.estado.update(dados)
+        # Acorda quem acompanha o progresso e arma um evento novo para a próxima mudança
+        self.mudou.set()
+        self.mudou = asyncio.Event()
+
+    @property
+    def terminado(self):
+        return self.estado['status'] in TERMINADOS
+
+
+class Servico:
+    """Pool de processos com fila limitada; um por processo do `servico.py`."""
+
+    def __init__(self, workers=None, fila=FILA_PADRAO, template_path=TEMPLATE_PADRAO, timeout=TIMEOUT_PADRAO,
+                 historico_path=HISTORICO_DB_PATH):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.fila = max(0, fila)
+        self.template_path = template_path
+        self.timeout = timeout
+        self.historico_path = historico_path
+        self.pedidos = OrderedDict()
+        self.ativos = 0  # na fila ou gerando
+        self._gerenciador = multiprocessing.Manager()
+        self._progresso = self._gerenciador.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._vagas = None
+        self._loop = None
+
+    async def iniciar(self):
+        self._loop = asyncio.get_running_loop()
+        self._vagas = asyncio.Semaphore(self.workers)
+        threading.Thread(target=self._ler_progresso, daemon=True).start()
+
+    def encerrar(self):
+        self._progresso.put(None)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._gerenciador.shutdown()
+
+    def _ler_progresso(self):
+        # Thread própria: o get da fila do Manager bloqueia
+        while True:
+            item = self._progresso.get()
+            if item is None:
+                return
+            id_pedido, dados = item
+            self._loop.call_soon_threadsafe(self._aplicar_progresso, id_pedido, dados)
+
+    def _aplicar_progresso(self, id_pedido, dados):
+        pedido = self.pedidos.get(id_pedido)
+        if pedido is not None and not pedido.terminado:
+            pedido.atualizar(**dados)
+
+    def situacao(self):
+        return {'workers': self.workers, 'fila_max': self.fila, 'ativos': self.ativos,
+                'livres': max(0, self.workers + self.fila - self.ativos), 'guardados': len(self.pedidos)}
+
+    def enviar(self, arquivo, conteudo, recarga, razao_social, config):
+        if self.ativos >= self.workers + self.fila:
+            raise ErroHttp(429, "Fila cheia, tente de novo em instantes.")
+        pedido = Pedido(uuid.uuid4().hex, arquivo, razao_social, recarga)
+        self.pedidos[pedido.id] = pedido
+        self.ativos += 1
+        self._descartar_antigos()
+        pedido.tarefa = asyncio.ensure_future(self._rodar(pedido, conteudo, config))
+        # Pelo callback, e não num finally, para contar também a tarefa cancelada antes de começar
+        pedido.tarefa.add_done_callback(self._liberar)
+        return pedido
+
+    def _liberar(self, tarefa):
+        self.ativos -= 1
+
+    def descartar(self, pedido):
+        del self.pedidos[pedido.id]
+        if pedido.terminado:
+            return
+        if not pedido.gerando:
+            pedido.tarefa.cancel()
+        # Processo do pool não dá para interromper: ele termina e o resultado é ignorado
+        pedido.terminar(status='cancelado', mensagem="Pedido descartado.")
+
+    def _descartar_antigos(self):
+        terminados = [p.id for p in self.pedidos.values() if p.terminado]
+        for id_pedido in terminados[:max(0, len(terminados) - PEDIDOS_GUARDADOS)]:
+            del self.pedidos[id_pedido]
+
+    async def _rodar(self, pedido, conteudo, config):
+        try:
+            async with self._vagas:
+                pedido.gerando = True
+                futuro = self._loop.run_in_executor(
+                    self._pool, executar_pedido, pedido.id, pedido.arquivo, conteudo, pedido.recarga,
+                    pedido.razao_social, config, self.template_path, self._progresso, self.timeout,
+                    self.historico_path,
+                )
+                xlsx, csv_rejeitados, pendente = await futuro
+            if not pedido.terminado:
+                pedido.xlsx, pedido.csv_rejeitados = xlsx, csv_rejeitados
+                pedido.terminar(status='pronto', terminado_em=time.time())
+                # Só a recarga entregue vira a "última" do cliente; a descartada no meio não
+                if pendente is not None:
+                    asyncio.ensure_future(self._guardar(pendente))
+        except TempoEsgotado:
+            pedido.terminar(status='erro', mensagem=f"Passou de {self.timeout}s")
+        except Exception as e:
+            pedido.terminar(status='erro', mensagem=str(e) or type(e).__name__)
+
+    async def _guardar(self, pendente):
+        # Monta o XML da próxima recarga depois da entrega, numa vaga do pool como qualquer pedido
+        try:
+            async with self._vagas:
+                await self._loop.run_in_executor(self._pool, guardar_historico, pendente, self.historico_path)
+        except Exception as e:
+            print(f"Histórico de {pendente.cliente} não foi guardado: {e}", file=sys.stderr, flush=True)
+
+    def pedido(self, id_pedido):
+        if id_pedido not in self.pedidos:
+            raise ErroHttp(404, "Pedido não encontrado.")
+        return self.pedidos[id_pedido]
+
+# ==========================================
+# HTTP
+# ==========================================
+
+def _json(dados):
+    return json.dumps(dados, ensure_ascii=False, default=str).encode("utf-8")
+
+async def _ler_requisicao(reader):
+    linha = await reader.readline()
+    if not linha.strip():
+        return None
+    try:
+        metodo, alvo, _ = linha.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ErroHttp(400)
+    cabecalhos = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        chave, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[chave.strip().lower()] = valor.strip()
+    try:
+        tamanho = int(cabecalhos.get("content-length") or 0)
+    except ValueError:
+        raise ErroHttp(400, "Content-Length inválido.")
+    if tamanho < 0:
+        raise ErroHttp(400, "Content-Length inválido.")
+    if tamanho > TAMANHO_MAX:
+        raise ErroHttp(413, f"Lista maior que {TAMANHO_MAX // 2 ** 20} MB.")
+    corpo = await reader.readexactly(tamanho) if tamanho else b""
+    return metodo.upper(), alvo.split("?", 1)[0].rstrip("/"), corpo
+
+async def _responder(writer, status, corpo=b"", tipo="application/json", extras=None):
+    cabecalho = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {tipo}",
+                 f"Content-Length: {len(corpo)}", "Connection: close"]
+    cabecalho += [f"{k}: {v}" for k, v in (extras or {}).items()]
+    writer.write(("\r\n".join(cabecalho) + "\r\n\r\n").encode("latin-1") + corpo)
+    await writer.drain()
+
+async def _transmitir_progresso(writer, pedido):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                 b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+    while True:
+        evento = pedido.mudou
+        linha = _json(pedido.estado) + b"\n"
+        writer.write(f"{len(linha):X}\r\n".encode() + linha + b"\r\n")
+        await writer.drain()
+        if pedido.terminado:
+            break
+        await evento.wait()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+def _ler_envio(corpo):
+    try:
+        dados = json.loads(corpo)
+        conteudo = base64.b64decode(dados["conteudo_base64"], validate=True)
+        arquivo = os.path.basename(str(dados["arquivo"]))
+        config = dados["config_rh"]
+    except (ValueError, KeyError, TypeError):
+        raise ErroHttp(400, "Envie JSON com arquivo, conteudo_base64 e config_rh.")
+    if not arquivo.lower().endswith((".xlsx", ".xls", ".csv", ".docx", ".txt")):
+        raise ErroHttp(400, "Formato de lista não aceito.")
+    return arquivo, conteudo, bool(dados.get("recarga", False)), str(dados.get("razao_social") or "Cliente"), config
+
+async def _atender(servico, reader, writer):
+    try:
+        requisicao = await _ler_requisicao(reader)
+        if requisicao is None:
+            return
+        metodo, caminho, corpo = requisicao
+        partes = caminho.strip("/").split("/")
+
+        if metodo == "GET" and partes == ["saude"]:
+            await _responder(writer, 200, _json(servico.situacao()))
+        elif metodo == "POST" and partes == ["pedidos"]:
+            pedido = servico.enviar(*_ler_envio(corpo))
+            await _responder(writer, 202, _json(pedido.estado), extras={"Location": f"/pedidos/{pedido.id}"})
+        elif len(partes) >= 2 and partes[0] == "pedidos":
+            pedido = servico.pedido(partes[1])
+            extra = partes[2] if len(partes) == 3 else None
+            if metodo == "DELETE" and extra is None:
+                servico.descartar(pedido)
+                await _responder(writer, 204)
+            elif metodo != "GET" or len(partes) > 3:
+                raise ErroHttp(404)
+            elif extra is None:
+                await _responder(writer, 200, _json(pedido.estado))
+            elif extra == "progresso":
+                await _transmitir_progresso(writer, pedido)
+            elif extra in ("arquivo", "rejeitados"):
+                if pedido.estado['status'] != 'pronto':
+                    raise ErroHttp(409, f"Pedido {pedido.estado['status']}.")
+                if extra == "arquivo":
+                    await _responder(writer, 200, pedido.xlsx,
+                                     "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                else:
+                    await _responder(writer, 200, pedido.csv_rejeitados, "text/csv; charset=utf-8")
+            else:
+                raise ErroHttp(404)
+        else:
+            raise ErroHttp(404)
+    except ErroHttp as e:
+        extras = {"Retry-After": "5"} if e.status == 429 else None
+        await _responder(writer, e.status, _json({'erro': e.mensagem}), extras=extras)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def servir(host=HOST_PADRAO, porta=PORTA_PADRAO, workers=None, fila=FILA_PADRAO,
+                 template_path=TEMPLATE_PADRAO, timeout=TIMEOUT_PADRAO, pronto=None, historico_path=HISTORICO_DB_PATH):
+    """Roda o serviço até ser cancelado. `pronto` (opcional) recebe o servidor já ouvindo."""
+    servico = Servico(workers, fila, template_path, timeout, historico_path)
+    await servico.iniciar()
+    servidor = await asyncio.start_server(lambda r, w: _atender(servico, r, w), host, porta)
+    if pronto:
+        pronto(servidor)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        servico.encerrar()
+
+# ==========================================
+# CLIENTE (USADO PELA TELA)
+# ==========================================
+
+class ErroServico(Exception):
+    pass
+
+
+class ClienteServico:
+    def __init__(self, url, timeout=(5, 60)):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.sessao = requests.Session()
+
+    def _verificar(self, resp):
+        if resp.status_code >= 400:
+            try:
+                mensagem = resp.json().get('erro', '')
+            except ValueError:
+                mensagem = resp.text
+            raise ErroServico(f"Serviço respondeu {resp.status_code}: {mensagem}")
+        return resp
+
+    def enviar(self, arquivo, conteudo, recarga, razao_social, config):
+        """Manda a lista para a fila e devolve o id do pedido."""
+        corpo = {'arquivo': arquivo, 'conteudo_base64': base64.b64encode(conteudo).decode("ascii"),
+                 'recarga': bool(recarga), 'razao_social': razao_social, 'config_rh': config}
+        resp = self.sessao.post(f"{self.url}/pedidos", json=corpo, timeout=self.timeout)
+        return self._verificar(resp).json()['id']
+
+    def acompanhar(self, id_pedido):
+        """Gera a situação do pedido a cada mudança, até ficar pronto ou dar erro."""
+        with self.sessao.get(f"{self.url}/pedidos/{id_pedido}/progresso", stream=True,
+                             timeout=(self.timeout[0], None)) as resp:
+            self._verificar(resp)
+            for linha in resp.iter_lines():
+                if linha:
+                    yield json.loads(linha)
+
+    def arquivo(self, id_pedido):
+        return self._verificar(self.sessao.get(f"{self.url}/pedidos/{id_pedido}/arquivo", timeout=self.timeout)).content
+
+    def rejeitados(self, id_pedido):
+        return self._verificar(
+            self.sessao.get(f"{self.url}/pedidos/{id_pedido}/rejeitados", timeout=self.timeout)).content
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serviço local que gera as planilhas PLANSIP3C/RECARGA em segundo plano.")
+    ap.add_argument("--host", default=HOST_PADRAO, help=f"Endereço (padrão: {HOST_PADRAO})")
+    ap.add_argument("--porta", type=int, default=PORTA_PADRAO, help=f"Porta (padrão: {PORTA_PADRAO})")
+    ap.add_argument("--workers", type=int, default=None, help="Processos de geração (padrão: núcleos da máquina)")
+    ap.add_argument("--fila", type=int, default=FILA_PADRAO, help="Pedidos esperando além dos que estão gerando")
+    ap.add_argument("--timeout", type=int, default=TIMEOUT_PADRAO, help="Limite por pedido, em segundos")
+    ap.add_argument("--template", default=TEMPLATE_PADRAO, help="Modelo PLANSIP3C a usar")
+    args = ap.parse_args(argv)
+
+    def avisar(servidor):
+        print(f"Serviço de pedidos ouvindo em http://{args.host}:{args.porta}", flush=True)
+
+    try:
+        asyncio.run(servir(args.host, args.porta, args.workers, args.fila, args.template, args.timeout, avisar))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import io
+
+import pandas as pd
+
+import benchmark
+from planilha import TEMPLATE_PADRAO, _celula, gerar_pedido
+from tratamento import _data_do_texto, converter_data
+
+LISTA = pd.DataFrame({'nome': ["ANA"], 'cpf': ["52998224725"], 'nascimento': ["01/01/1990"], 'valor': [0.0]})
+
+
+def test_cada_passada_comeca_com_os_caches_vazios():
+    caches = []
+
+    def funcao():
+        for dia in range(1, 29):
+            converter_data(f"{dia:02d}/03/1985 x", "01/01/1980")
+        gerar_pedido(TEMPLATE_PADRAO, LISTA, benchmark.CONFIG_RH, False, io.BytesIO())
+        caches.append((_data_do_texto.cache_info().hits, _celula.cache_info().hits))
+
+    benchmark.medir(funcao, repeticoes=3, memoria=True)
+    # Três passadas de tempo e uma de memória, nenhuma aproveitando o cache da anterior
+    assert len(caches) == 4
+    assert len(set(caches)) == 1
+    assert caches[0][0] == 0
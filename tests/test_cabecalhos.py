@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import cabecalhos
+from cabecalhos import assinatura_cabecalho, confirmar_cabecalho, resolver_cabecalho
+
+
+@pytest.fixture(autouse=True)
+def sem_confirmados(monkeypatch):
+    # Só o fuzzy: nada de mapeamentos gravados por outros usos
+    monkeypatch.setattr(cabecalhos, "_confirmados", {})
+
+
+@pytest.mark.parametrize("outra", ['data de admissão', 'data de desligamento', 'dt admissão', 'data de demissão',
+                                   'data contratação'])
+def test_outras_datas_nao_viram_nascimento(outra):
+    campos = resolver_cabecalho(['nome', 'cpf', outra, 'valor']).campos
+    assert campos['nascimento'] is None
+    assert (campos['nome'], campos['cpf'], campos['valor']) == ('nome', 'cpf', 'valor')
+
+
+@pytest.mark.parametrize("nasc", ['data de nascimento', 'dt nasc', 'data nasc', 'nascimento', 'data de nasc.',
+                                  'dt. nascimento'])
+def test_nascimento_ao_lado_da_admissao(nasc):
+    campos = resolver_cabecalho(['nome', 'cpf', 'data de admissão', nasc, 'valor']).campos
+    assert campos['nascimento'] == nasc
+
+
+def test_nome_da_mae_antes_do_salario():
+    campos = resolver_cabecalho(['nome da mae', 'cpf', 'nascimento', 'salario']).campos
+    assert campos['nome'] == 'nome da mae'
+    assert campos['cpf'] == 'cpf'
+
+
+def test_nome_do_funcionario_ganha_do_nome_da_mae():
+    campos = resolver_cabecalho(['nome da mae', 'nome do colaborador', 'cpf', 'salario']).campos
+    assert campos['nome'] == 'nome do colaborador'
+
+
+def test_cabecalho_comum():
+    campos = resolver_cabecalho(['Nome Completo', 'CPF', 'Data de Nascimento', 'Valor do Crédito']).campos
+    assert campos == {'nome': 'Nome Completo', 'cpf': 'CPF', 'nascimento': 'Data de Nascimento',
+                      'valor': 'Valor do Crédito'}
+
+
+@pytest.fixture
+def arquivo(tmp_path, monkeypatch):
+    caminho = tmp_path / "mapeamentos.json"
+    monkeypatch.setattr(cabecalhos, "MAPEAMENTOS_PATH", str(caminho))
+    monkeypatch.setattr(cabecalhos, "_confirmados", None)
+    return caminho
+
+def _gravar(caminho, headers, entrada):
+    caminho.write_text(json.dumps({assinatura_cabecalho(headers): entrada}), encoding="utf-8")
+
+
+HEADERS = ['nome', 'cpf', 'data de admissão', 'data de nascimento', 'valor']
+ERRADO = {'nome': 'nome', 'cpf': 'cpf', 'nascimento': 'data de admissão', 'valor': 'valor'}
+
+
+@pytest.mark.parametrize("entrada", [ERRADO, {'versao': cabecalhos.VERSAO_REGRAS - 1, 'campos': ERRADO}])
+def test_mapeamento_de_versao_antiga_e_ignorado(arquivo, entrada):
+    _gravar(arquivo, HEADERS, entrada)
+    resolucao = resolver_cabecalho(HEADERS)
+    assert not resolucao.confirmada
+    assert resolucao.campos['nascimento'] == 'data de nascimento'
+
+
+def test_correcao_do_usuario_fica_salva(arquivo):
+    resolucao = resolver_cabecalho(HEADERS)
+    corrigido = dict(resolucao.campos, valor=None)
+    confirmar_cabecalho(resolucao, corrigido)
+
+    salvo = json.loads(arquivo.read_text(encoding="utf-8"))[resolucao.assinatura]
+    assert salvo == {'versao': cabecalhos.VERSAO_REGRAS, 'campos': corrigido}
+    cabecalhos._confirmados = None  # como num processo novo
+    de_novo = resolver_cabecalho(HEADERS)
+    assert de_novo.confirmada and de_novo.campos == corrigido
+    assert de_novo.cabecalho == HEADERS
+
+
+def test_confirmado_sem_mudanca_nao_regrava(arquivo):
+    _gravar(arquivo, HEADERS, {'versao': cabecalhos.VERSAO_REGRAS, 'campos': ERRADO})
+    resolucao = resolver_cabecalho(HEADERS)
+    assert resolucao.confirmada and resolucao.campos == ERRADO
+    arquivo.unlink()
+    confirmar_cabecalho(resolucao)
+    assert not arquivo.exists()
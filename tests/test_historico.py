@@ -0,0 +1,118 @@
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import historico
+from historico import (HistoricoPedidos, diferenca_para_anterior, gerar_pedido_incremental, guardar_pedido,
+                       prefixo_cliente)
+from planilha import ABA_BENEFICIARIOS, PRIMEIRA_LINHA, TEMPLATE_PADRAO, gerar_pedido
+
+CONFIG = {'Local de entrega': "MATRIZ", 'CEP': "01310918", 'UF': "SP"}
+CREDITO = "01/01/2027"
+
+
+def _lista(n, valor=100.0):
+    return pd.DataFrame({'nome': [f"PESSOA {i}" for i in range(n)], 'cpf': [f"{i:011d}" for i in range(n)],
+                         'nascimento': ["01/01/1990"] * n, 'valor': [valor] * n})
+
+def _linhas(conteudo):
+    ws = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True)[ABA_BENEFICIARIOS]
+    return [r for r in ws.iter_rows(min_row=PRIMEIRA_LINHA, values_only=True) if r[2]]
+
+def _incremental(lista, hist, config=CONFIG):
+    buf = io.BytesIO()
+    _, dif, pendente = gerar_pedido_incremental(TEMPLATE_PADRAO, lista, config, True, buf, "RECARGA_ACME", hist,
+                                                dt_cred=CREDITO)
+    return buf.getvalue(), dif, pendente
+
+def _normal(lista, config=CONFIG):
+    buf = io.BytesIO()
+    gerar_pedido(TEMPLATE_PADRAO, lista, config, True, buf, dt_cred=CREDITO)
+    return buf.getvalue()
+
+@pytest.fixture
+def hist(tmp_path):
+    return HistoricoPedidos(str(tmp_path / "h.sqlite3"))
+
+
+@pytest.mark.parametrize("razao_social", ["Cliente_Novo", "Cliente_Legado", "cliente legado", "CLIENTE", "", None])
+def test_nome_provisorio_nao_tem_historico(razao_social):
+    assert prefixo_cliente(razao_social, True) is None
+
+
+def test_chave_e_o_nome_do_arquivo():
+    assert prefixo_cliente("ACME Ltda.", True) == "RECARGA_ACMELtda"
+    assert prefixo_cliente("ACME Ltda.", False) == "PLANSIP3C_ACMELtda"
+
+
+def test_recarga_incremental_avisa_o_progresso(hist, monkeypatch):
+    monkeypatch.setattr(historico, "AVISO_PROGRESSO", 10)
+    avisos = []
+    gerar_pedido_incremental(TEMPLATE_PADRAO, _lista(25), CONFIG, True, io.BytesIO(), "RECARGA_ACME", hist,
+                             progresso=avisos.append)
+    assert avisos == [10, 20, 25]
+
+
+def test_mesmas_linhas_que_o_pedido_normal(hist):
+    lista = _lista(40)
+    conteudo, dif, pendente = _incremental(lista, hist)
+    assert dif.primeiro
+    assert _linhas(conteudo) == _linhas(_normal(lista))
+    # Nada vai para o histórico antes de guardar_pedido
+    assert hist.gerado_em("RECARGA_ACME") is None
+    guardar_pedido(pendente, hist)
+
+    # Metade com valor novo, um CPF a menos e um a mais: reaproveitadas e montadas se misturam
+    segunda = _lista(41)
+    segunda.loc[::2, 'valor'] = 250.0
+    segunda = segunda.drop(index=5)
+    conteudo, dif, pendente = _incremental(segunda, hist)
+    assert (len(dif.novos), len(dif.alterados), len(dif.removidos)) == (1, 20, 1)
+    assert _linhas(conteudo) == _linhas(_normal(segunda))
+    guardar_pedido(pendente, hist)
+
+    conteudo, dif, _ = _incremental(segunda, hist)
+    assert dif.mantidos == 40
+    assert _linhas(conteudo) == _linhas(_normal(segunda))
+
+
+def test_outro_endereco_monta_tudo_de_novo(hist):
+    guardar_pedido(_incremental(_lista(10), hist)[2], hist)
+    outro = dict(CONFIG, CEP="20040020", UF="RJ")
+    conteudo, dif, pendente = _incremental(_lista(10), hist, outro)
+    assert dif.mantidos == 10
+    assert not pendente.parcial and pendente.montar.all()
+    assert _linhas(conteudo) == _linhas(_normal(_lista(10), outro))
+
+
+def test_pedido_guardado_no_meio_troca_tudo(hist):
+    guardar_pedido(_incremental(_lista(10), hist)[2], hist)
+    # Dois pedidos comparados com o mesmo anterior; o segundo é guardado por último
+    _, _, primeiro = _incremental(_lista(10, valor=300.0), hist)
+    _, _, segundo = _incremental(_lista(10), hist)
+    guardar_pedido(primeiro, hist)
+    guardar_pedido(segundo, hist)
+    _, anterior = hist.anterior("RECARGA_ACME")
+    assert list(anterior['valor']) == [100.0] * 10
+    conteudo, dif, _ = _incremental(_lista(10), hist)
+    assert dif.mantidos == 10
+    assert _linhas(conteudo) == _linhas(_normal(_lista(10)))
+
+
+def test_diferenca_guardada_ate_o_historico_mudar(hist, monkeypatch):
+    guardar_pedido(_incremental(_lista(10), hist)[2], hist)
+    leituras = []
+    anterior = hist.anterior
+    monkeypatch.setattr(hist, "anterior", lambda *a, **k: leituras.append(1) or anterior(*a, **k))
+
+    lista = _lista(12)
+    assert len(diferenca_para_anterior("RECARGA_ACME", lista, hist, "upload-1").novos) == 2
+    assert len(diferenca_para_anterior("RECARGA_ACME", lista, hist, "upload-1").novos) == 2
+    assert len(leituras) == 1
+
+    guardar_pedido(_incremental(lista, hist)[2], hist)
+    leituras.clear()
+    assert len(diferenca_para_anterior("RECARGA_ACME", lista, hist, "upload-1").novos) == 0
+    assert len(leituras) == 1
@@ -0,0 +1,173 @@
+import csv
+import io
+import random
+import re
+from datetime import datetime
+
+import docx
+import openpyxl
+import pandas as pd
+import pytest
+from dateutil import parser
+
+import cabecalhos
+import leitura
+from leitura import ler_lista, ler_lista_em_lotes, ler_word_txt, lotes_word_txt
+
+CABECALHO = ["Nome", "CPF", "Data Nascimento", "Valor", "Nome", "Setor"]
+NOMES = ["João da Silva", "  maria SOUZA ", "Zé", None, "", 123, "Ana Maria de Souza Pereira Albuquerque Neto"]
+CPFS = ["123.456.789-09", 12345678909, "52998224725", None, "", "abc", 529982247.25]
+DATAS = ["#N/A", "01/02/1990", datetime(1985, 3, 4), 32874, "nasc 15/07/2001", None, "", "31/02/2020", 1031985]
+VALORES = ["#DIV/0!", 150.0, "R$ 1.234,56", 150, 150.75, "1,5", None, "", "abc", 0]
+
+
+@pytest.fixture(autouse=True)
+def sem_confirmados(monkeypatch):
+    monkeypatch.setattr(cabecalhos, "_confirmados", {})
+
+
+def _linhas(semente, n):
+    rnd = random.Random(semente)
+    return [[rnd.choice(NOMES), rnd.choice(CPFS), rnd.choice(DATAS), rnd.choice(VALORES), "OUTRO", "RH"]
+            for _ in range(n)]
+
+def _xlsx(linhas):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Relatório de funcionários"])
+    ws.append([])
+    ws.append(CABECALHO)
+    for linha in linhas:
+        ws.append(linha)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def _csv(linhas):
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    escritor.writerow(["Relatório de funcionários"] + [""] * 5)
+    escritor.writerow(CABECALHO)
+    for linha in linhas:
+        escritor.writerow(["" if v is None else v.strftime("%d/%m/%Y") if isinstance(v, datetime) else v
+                           for v in linha])
+    return buf.getvalue().encode("utf-8")
+
+def _em_lotes(nome, conteudo, recarga, tamanho_lote):
+    leitura = ler_lista_em_lotes(nome, conteudo, recarga, tamanho_lote=tamanho_lote)
+    lista = pd.concat(list(leitura.lista), ignore_index=True)
+    return leitura, lista
+
+
+@pytest.mark.parametrize("formato", ["xlsx", "csv"])
+@pytest.mark.parametrize("recarga", [False, True])
+@pytest.mark.parametrize("semente", range(3))
+def test_leitura_em_lotes_igual_a_completa(formato, recarga, semente):
+    conteudo = (_xlsx if formato == "xlsx" else _csv)(_linhas(semente, 120))
+    nome = f"lista.{formato}"
+    completa = ler_lista(nome, conteudo, recarga)
+    for tamanho_lote in (1, 13, 1000):
+        leitura, lista = _em_lotes(nome, conteudo, recarga, tamanho_lote)
+        pd.testing.assert_frame_equal(lista, completa.lista)
+        assert leitura.colunas == completa.colunas
+        assert leitura.avisos == completa.avisos
+        assert leitura.datas == completa.datas
+
+
+def test_lotes_do_caminho_do_arquivo(tmp_path):
+    conteudo = _xlsx(_linhas(7, 50))
+    caminho = tmp_path / "lista.xlsx"
+    caminho.write_bytes(conteudo)
+    _, lista = _em_lotes("lista.xlsx", str(caminho), True, 8)
+    pd.testing.assert_frame_equal(lista, ler_lista("lista.xlsx", conteudo, True).lista)
+
+
+# ==========================================
+# WORD / TXT
+# ==========================================
+
+def _parser_antigo(linhas):
+    """O parser Word/TXT do app antes da leitura em lotes, sobre as linhas já sem vazias."""
+    dados, atual = [], {'nome': '', 'cpf': '', 'datas': []}
+
+    def salvar(p):
+        if p['nome'] and p['cpf']:
+            validas = []
+            for d in p['datas']:
+                try:
+                    validas.append((parser.parse(d.replace('-', '/'), dayfirst=True), d))
+                except Exception:
+                    pass
+            dados.append({'nome': p['nome'], 'cpf': p['cpf'], 'nascimento': validas[0][1] if validas else "",
+                          'valor': 0})
+
+    for l in linhas:
+        nums = re.sub(r'\D', '', l)
+        m_data = re.search(r'\d{2}[/-]\d{2}[/-]\d{2,4}', l)
+        if m_data:
+            atual['datas'].append(m_data.group())
+        elif 9 <= len(nums) <= 14:
+            if not atual['cpf']:
+                atual['cpf'] = nums
+        else:
+            salvar(atual)
+            atual = {'nome': l, 'cpf': '', 'datas': []}
+    salvar(atual)
+    return pd.DataFrame(dados)
+
+LINHAS_TEXTO = ["João da Silva", "  Maria Souza  ", "CPF: 123.456.789-09", "529.982.247-25", "12345678",
+                "Nascimento: 01/02/1990", "Admissão 05-06-2010", "31/02/2020", "99/99/99", "nasc 04/13/1985",
+                "", "   ", "Zé Ninguém 🙂", "Telefone (11) 99999-9999", "1/2/90", "RG 12.345.678-9",
+                "CNPJ 12.345.678/0001-95", "Matrícula 123456789012345"]
+
+
+def _texto_fuzz(semente, n=300):
+    rnd = random.Random(semente)
+    return [rnd.choice(LINHAS_TEXTO) for _ in range(n)]
+
+def _docx(linhas):
+    documento = docx.Document()
+    documento.add_paragraph("Lista de funcionários")
+    for i, linha in enumerate(linhas):
+        p = documento.add_paragraph(linha)
+        if i % 17 == 0:
+            p.add_run().add_tab()
+            p.add_run(" complemento")
+    tabela = documento.add_table(rows=1, cols=2)
+    tabela.cell(0, 0).text = "Fora da lista"
+    tabela.cell(0, 1).text = "123.456.789-09"
+    buf = io.BytesIO()
+    documento.save(buf)
+    return buf.getvalue()
+
+def _linhas_antigas_docx(conteudo):
+    return [p.text.strip() for p in docx.Document(io.BytesIO(conteudo)).paragraphs if p.text.strip()]
+
+def _linhas_antigas_txt(conteudo):
+    return [l.strip() for l in conteudo.decode("utf-8", errors="ignore").splitlines() if l.strip()]
+
+
+@pytest.mark.parametrize("semente", range(4))
+def test_txt_igual_ao_parser_antigo(semente):
+    conteudo = ("\r\n" if semente % 2 else "\n").join(_texto_fuzz(semente)).encode("utf-8")
+    esperado = _parser_antigo(_linhas_antigas_txt(conteudo))
+    pd.testing.assert_frame_equal(ler_word_txt("lista.txt", conteudo), esperado)
+    lotes = list(lotes_word_txt("lista.txt", conteudo, tamanho_lote=7))
+    pd.testing.assert_frame_equal(pd.concat(lotes, ignore_index=True), esperado)
+
+
+@pytest.mark.parametrize("semente", range(3))
+def test_docx_igual_ao_parser_antigo(semente):
+    conteudo = _docx(_texto_fuzz(semente))
+    esperado = _parser_antigo(_linhas_antigas_docx(conteudo))
+    pd.testing.assert_frame_equal(ler_word_txt("lista.docx", conteudo), esperado)
+    lotes = list(lotes_word_txt("lista.docx", conteudo, tamanho_lote=7))
+    pd.testing.assert_frame_equal(pd.concat(lotes, ignore_index=True), esperado)
+
+
+@pytest.mark.parametrize("tamanho_bloco", [1, 2, 3, 5, 64])
+def test_txt_em_blocos_nao_quebra_linha_nem_acento(tamanho_bloco):
+    # Acentos e emoji com vários bytes, \r\n e \r sozinho caindo na divisa dos blocos
+    texto = "Zé\r\nJoão 🙂\rAna\n\nçãõ\r\né́ fim"
+    obtido = list(leitura._linhas_txt(texto.encode("utf-8"), tamanho_bloco))
+    assert obtido == texto.splitlines(keepends=True)
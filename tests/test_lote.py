@@ -0,0 +1,75 @@
+import functools
+import os
+import time
+
+import openpyxl
+import pytest
+
+import leitura
+import lote
+from planilha import ABA_BENEFICIARIOS, PRIMEIRA_LINHA, PRODUTOS
+
+CONFIG = {'Local de entrega': "MATRIZ", 'CEP': "01310918", 'Endereço': "Av Paulista", 'Número': "1000",
+          'Complemento': "", 'Referência': "", 'Bairro': "Bela Vista", 'Cidade': "Sao Paulo", 'UF': "SP",
+          'Responsável': "Ana", 'DDD': "11", 'Telefone': "999999999", 'Email': "", 'Porta_a_Porta': "Não"}
+
+
+def _cpf(i):
+    base = [int(d) for d in f"{i + 100000000:09d}"]
+    for pesos in (range(10, 1, -1), range(11, 1, -1)):
+        resto = sum(d * p for d, p in zip(base, pesos)) * 10 % 11
+        base.append(resto % 10)
+    return "".join(map(str, base))
+
+@pytest.fixture
+def lista(tmp_path, monkeypatch):
+    # Lotes pequenos para a gravação passar por várias partes
+    monkeypatch.setattr(lote, "ler_lista_em_lotes", functools.partial(leitura.ler_lista_em_lotes, tamanho_lote=50))
+    caminho = tmp_path / "acme.csv"
+    linhas = ["Nome,CPF,Nascimento,Valor"] + [f"PESSOA {i},{_cpf(i)},01/01/1990,100" for i in range(500)]
+    caminho.write_text("\n".join(linhas + ["RUIM,11111111111,01/01/1990,10"]), encoding="utf-8")
+    return str(caminho)
+
+
+def test_gera_planilha_e_relatorio(lista, tmp_path):
+    saida = tmp_path / "saida"
+    saida.mkdir()
+    r = lote.gerar_arquivo(lista, "ACME", True, CONFIG, str(saida))
+    assert r['status'] == 'ok'
+    assert sorted(os.listdir(saida)) == ["RECARGA_ACME.xlsx", "RECARGA_ACME_rejeitados.csv"]
+    ws = openpyxl.load_workbook(r['saida'], read_only=True)[ABA_BENEFICIARIOS]
+    assert sum(1 for l in ws.iter_rows(min_row=PRIMEIRA_LINHA, values_only=True) if l[2]) == 500 * len(PRODUTOS)
+
+
+@pytest.mark.skipif(not hasattr(lote.signal, "SIGALRM"), reason="limite de tempo usa SIGALRM")
+def test_tempo_esgotado_nao_deixa_planilha_cortada(lista, tmp_path, monkeypatch):
+    separar = lote.separar_rejeitados
+
+    def devagar(*args):
+        time.sleep(0.3)
+        return separar(*args)
+
+    monkeypatch.setattr(lote, "separar_rejeitados", devagar)
+    saida = tmp_path / "saida"
+    saida.mkdir()
+    r = lote.gerar_arquivo(lista, "ACME", True, CONFIG, str(saida), timeout=1)
+    assert r['status'] == 'tempo esgotado'
+    assert os.listdir(saida) == []
+
+
+def test_erro_no_meio_nao_deixa_planilha_cortada(lista, tmp_path, monkeypatch):
+    chamadas = []
+    separar = lote.separar_rejeitados
+
+    def falha_no_terceiro(*args):
+        chamadas.append(1)
+        if len(chamadas) == 3:
+            raise ValueError("lote ilegível")
+        return separar(*args)
+
+    monkeypatch.setattr(lote, "separar_rejeitados", falha_no_terceiro)
+    saida = tmp_path / "saida"
+    saida.mkdir()
+    r = lote.gerar_arquivo(lista, "ACME", True, CONFIG, str(saida))
+    assert r['status'] == 'erro'
+    assert os.listdir(saida) == []
@@ -0,0 +1,153 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from lovable import ClienteLovable, ErroLovable
+
+
+class StubSupabase:
+    """Auth e api-vendas do Supabase em memória, numa porta livre do localhost."""
+
+    def __init__(self, vendas):
+        self.vendas = vendas
+        self.logins = 0
+        self.renovacoes = 0
+        self.pedidos_vendas = []
+        self.tokens = set()
+        self.falhar_offsets = set()
+        self.ordenar = True
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status, dados):
+                corpo = json.dumps(dados).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                tipo = parse_qs(url.query)["grant_type"][0]
+                if tipo == "password":
+                    if corpo["password"] != "certa":
+                        return self._json(400, {"error": "invalid_grant"})
+                    stub.logins += 1
+                else:
+                    stub.renovacoes += 1
+                token = f"t{stub.logins}-{stub.renovacoes}"
+                stub.tokens.add(token)
+                self._json(200, {"access_token": token, "refresh_token": "r", "expires_in": 3600})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if self.headers.get("Authorization", "")[len("Bearer "):] not in stub.tokens:
+                    return self._json(401, {"error": "jwt expired"})
+                stub.pedidos_vendas.append(params)
+                offset, limite = int(params["offset"]), int(params["limit"])
+                if offset in stub.falhar_offsets:
+                    return self._json(500, {"error": "boom"})
+                vendas = [v for v in stub.vendas if v["updated_at"] > params.get("updated_since", "")]
+                if stub.ordenar:
+                    vendas.sort(key=lambda v: (v["updated_at"], v["id"]))
+                self._json(200, {"vendas": vendas[offset:offset + limite]})
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def _venda(i, dia, razao=None):
+    return {"id": i, "updated_at": f"2026-01-{dia:02d}T00:00:00", "cliente_nome": razao or f"EMPRESA {i}",
+            "endereco_cep": "01310918", "estado": "SP"}
+
+
+@pytest.fixture
+def stub():
+    s = StubSupabase([_venda(i, 1 + i) for i in range(1, 6)])
+    yield s
+    s.fechar()
+
+
+@pytest.fixture
+def cliente(stub, tmp_path):
+    return ClienteLovable("a@b.com", "certa", url_base=stub.url, db_path=str(tmp_path / "crm.sqlite3"),
+                          tamanho_pagina=2)
+
+
+def test_pagina_e_reaproveita_login(stub, cliente):
+    assert cliente.sincronizar() == 5
+    assert cliente.total_vendas() == 5
+    assert [p["offset"] for p in stub.pedidos_vendas] == ["0", "2", "4"]
+    assert all(p["order"] == "updated_at.asc,id.asc" for p in stub.pedidos_vendas)
+    assert cliente.razoes_sociais() == [f"EMPRESA {i}" for i in range(1, 6)]
+    assert cliente.venda_por_razao("EMPRESA 3")["uf"] == "SP"
+
+    cliente.sincronizar(forcar=True)
+    assert stub.logins == 1
+
+
+def test_ressincronizacao_so_pede_o_que_mudou(stub, cliente):
+    cliente.sincronizar()
+    stub.vendas.append(_venda(6, 20))
+    stub.vendas[0] = _venda(1, 21, "EMPRESA UM")
+    stub.pedidos_vendas.clear()
+
+    assert cliente.sincronizar(forcar=True) == 2
+    assert stub.pedidos_vendas[0]["updated_since"] == "2026-01-06T00:00:00"
+    assert cliente.total_vendas() == 6
+    assert cliente.venda_por_razao("EMPRESA UM")["id"] == 1
+
+
+def test_401_renova_o_token(stub, cliente):
+    cliente.sincronizar()
+    stub.tokens.clear()  # servidor revogou o token antes da hora
+    stub.vendas.append(_venda(6, 20))
+
+    assert cliente.sincronizar(forcar=True) == 1
+    assert stub.renovacoes == 1
+    assert stub.logins == 1
+
+
+def test_pagina_com_erro_nao_perde_vendas(stub, cliente):
+    # Servidor sem ordem: a primeira página traz as mais recentes
+    stub.ordenar = False
+    stub.vendas = [_venda(1, 10), _venda(2, 9), _venda(3, 2), _venda(4, 3)]
+    stub.falhar_offsets = {2}
+    with pytest.raises(ErroLovable):
+        cliente.sincronizar()
+    assert cliente.total_vendas() == 2
+
+    stub.falhar_offsets = set()
+    cliente.sincronizar(forcar=True)
+    assert cliente.total_vendas() == 4
+
+
+def test_falha_espera_antes_de_tentar_de_novo(stub, cliente):
+    stub.falhar_offsets = {0}
+    with pytest.raises(ErroLovable):
+        cliente.sincronizar()
+    pedidos = len(stub.pedidos_vendas)
+
+    assert cliente.sincronizar() == 0
+    assert len(stub.pedidos_vendas) == pedidos
+
+
+def test_senha_errada(stub, tmp_path):
+    cliente = ClienteLovable("a@b.com", "errada", url_base=stub.url, db_path=str(tmp_path / "crm.sqlite3"))
+    with pytest.raises(ErroLovable):
+        cliente.sincronizar()
+    assert not cliente.autenticado
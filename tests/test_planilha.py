@@ -0,0 +1,174 @@
+import datetime
+import io
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.utils import get_column_letter
+
+from planilha import (ABA_BENEFICIARIOS, COLUNAS_ENDERECO_ANTIGO, PRIMEIRA_LINHA, PRODUTOS, TEMPLATE_PADRAO,
+                      carregar_modelo, gerar_pedido, ler_endereco_antigo, ler_enderecos_antigos)
+
+CONFIG = {'Local de entrega': "MATRIZ", 'CEP': "01310918", 'Endereço': "Av Paulista", 'Número': "1000",
+          'Complemento': "", 'Referência': "", 'Bairro': "Bela Vista", 'Cidade': "Sao Paulo", 'UF': "SP",
+          'Responsável': "Ana", 'DDD': "11", 'Telefone': "999999999", 'Email': "", 'Porta_a_Porta': "Não"}
+
+
+def _lista(n, prefixo="PESSOA"):
+    return pd.DataFrame({'nome': [f"{prefixo} {i}" for i in range(n)], 'cpf': [f"{i:011d}" for i in range(n)],
+                         'nascimento': ["01/01/1990"] * n, 'valor': [100.0] * n})
+
+def _pedido(n, prefixo):
+    buf = io.BytesIO()
+    gerar_pedido(TEMPLATE_PADRAO, _lista(n, prefixo), CONFIG, True, buf)
+    return buf.getvalue()
+
+
+def test_gravacoes_simultaneas_nao_se_misturam():
+    carregar_modelo(TEMPLATE_PADRAO)
+    tarefas = [(50 + 7 * i, f"T{i}") for i in range(36)]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        saidas = list(pool.map(lambda t: _pedido(*t), tarefas))
+
+    for (n, prefixo), conteudo in zip(tarefas, saidas):
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+            assert zf.testzip() is None
+        ws = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True)[ABA_BENEFICIARIOS]
+        nomes = [r[2] for r in ws.iter_rows(min_row=PRIMEIRA_LINHA, values_only=True) if r[2]]
+        assert len(nomes) == n * len(PRODUTOS)
+        assert nomes[0] == f"{prefixo} 0"
+
+
+
+# ==========================================
+# ENDEREÇO DA PLANILHA ANTIGA x load_workbook(data_only=True)
+# ==========================================
+
+def _endereco_load_workbook(conteudo):
+    # Leitura que o app fazia antes (load_workbook completo), como referência
+    ws = openpyxl.load_workbook(io.BytesIO(conteudo), data_only=True)["Dados dos Beneficiários"]
+    l_dados = 8
+    return {
+        'Local de entrega': str(ws.cell(row=l_dados, column=16).value or "MATRIZ").replace('None', ''),
+        'CEP': str(ws.cell(row=l_dados, column=17).value or "").replace('None', ''),
+        'Endereço': str(ws.cell(row=l_dados, column=18).value or "").replace('None', ''),
+        'Número': str(ws.cell(row=l_dados, column=19).value or "").replace('None', ''),
+        'Complemento': str(ws.cell(row=l_dados, column=20).value or "").replace('None', ''),
+        'Bairro': str(ws.cell(row=l_dados, column=22).value or "").replace('None', '')[:30],
+        'Cidade': str(ws.cell(row=l_dados, column=23).value or "").replace('None', '')[:30],
+        'UF': str(ws.cell(row=l_dados, column=24).value or "SP").replace('None', '')[:2].upper(),
+        'Responsável': str(ws.cell(row=l_dados, column=25).value or "").replace('None', ''),
+        'DDD': str(ws.cell(row=l_dados, column=26).value or "").replace('None', '')[:2],
+        'Telefone': str(ws.cell(row=l_dados, column=27).value or "").replace('None', ''),
+        'Email': str(ws.cell(row=l_dados, column=28).value or "").replace('None', ''),
+        'Porta_a_Porta': str(ws.cell(row=l_dados, column=29).value or "Não").replace('None', 'Não'),
+    }
+
+VALORES_ANTIGOS = ["FILIAL 2", "01310-918", 1310918, 11.0, 0, 12.5, "", "None", "sp", "rj ", "São Paulo " * 5,
+                   "Av. Brasil & Cia <1>", "  ", True, False, None, datetime.date(2024, 2, 29),
+                   datetime.datetime(2023, 7, 1, 14, 30), datetime.time(8, 15), "x_x005F_y", "Sim", "Não",
+                   "(11) 3333-4444", 11987654321, -3, "a@b.com.br", "Zé 🙂"]
+
+# Células reescritas direto no XML: texto inline e fórmula com valor em cache
+CELULAS_XML = [
+    '<c r="{ref}" t="inlineStr"><is><t>Rua Inline 10</t></is></c>',
+    '<c r="{ref}" t="inlineStr"><is><r><t>Rich </t></r><r><t>Text</t></r></is></c>',
+    '<c r="{ref}"><f>1+1</f><v>2</v></c>',
+    '<c r="{ref}" t="str"><f>"MOO"&amp;"CA"</f><v>MOOCA</v></c>',
+    '<c r="{ref}" t="b"><f>TRUE()</f><v>1</v></c>',
+    '<c r="{ref}" t="e"><f>1/0</f><v>#DIV/0!</v></c>',
+    '<c r="{ref}"><f>A1</f></c>',
+]
+
+def _planilha_antiga(rng, epoca_1904=False, xml_crus=0, sem_linha=False, compartilhados=True):
+    wb = openpyxl.Workbook()
+    wb.active.title = "Capa"
+    wb.active["A1"] = "capa"
+    if epoca_1904:
+        wb.epoch = openpyxl.utils.datetime.CALENDAR_MAC_1904
+    ws = wb.create_sheet(ABA_BENEFICIARIOS)
+    for linha in (1, 7, 9, 10):
+        for coluna in COLUNAS_ENDERECO_ANTIGO:
+            ws.cell(row=linha, column=coluna, value=f"L{linha}C{coluna}")
+    crus = {}
+    if not sem_linha:
+        colunas = list(COLUNAS_ENDERECO_ANTIGO)
+        for coluna in colunas:
+            valor = VALORES_ANTIGOS[rng.integers(len(VALORES_ANTIGOS))]
+            celula = ws.cell(row=PRIMEIRA_LINHA, column=coluna, value=valor)
+            if isinstance(valor, (datetime.date, datetime.time)):
+                celula.number_format = rng.choice(["dd/mm/yyyy", "yyyy-mm-dd hh:mm", "hh:mm", "0.00"])
+        for coluna in rng.choice(colunas, size=xml_crus, replace=False):
+            ws.cell(row=PRIMEIRA_LINHA, column=int(coluna), value=0)
+            crus[f"{get_column_letter(int(coluna))}{PRIMEIRA_LINHA}"] = CELULAS_XML[rng.integers(len(CELULAS_XML))]
+    buf = io.BytesIO()
+    wb.save(buf)
+    if not crus and not compartilhados:
+        return buf.getvalue()
+
+    # O openpyxl grava todo texto inline; o Excel usa a tabela de textos compartilhados.
+    # Os textos vão para ela fora de ordem e com sobras, para o índice não ser a posição.
+    with zipfile.ZipFile(buf) as zin:
+        partes = {item.filename: zin.read(item) for item in zin.infolist()}
+    xml = partes["xl/worksheets/sheet2.xml"].decode()
+    for ref, celula in crus.items():
+        xml, n = re.subn(rf'<c r="{ref}"[^>]*?(/>|>.*?</c>)', celula.format(ref=ref), xml)
+        assert n == 1
+    if compartilhados:
+        inline = re.compile(r'<c r="([A-Z]+\d+)"([^>]*?) t="inlineStr"><is>(<t[^>]*>[^<]*</t>)</is></c>')
+        textos = [f"<t>sobra {i}</t>" for i in range(int(rng.integers(0, 50)))] + [m[2] for m in inline.findall(xml)]
+        ordem = rng.permutation(len(textos))
+        indice = {int(j): i for i, j in enumerate(ordem)}
+        usados = iter(range(len(textos) - len(inline.findall(xml)), len(textos)))
+        xml = inline.sub(lambda m: f'<c r="{m[1]}"{m[2]} t="s"><v>{indice[next(usados)]}</v></c>', xml)
+        partes["xl/sharedStrings.xml"] = (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            + "".join(f"<si>{textos[int(j)]}</si>" for j in ordem) + "</sst>").encode()
+        partes["xl/_rels/workbook.xml.rels"] = partes["xl/_rels/workbook.xml.rels"].replace(
+            b"</Relationships>", b'<Relationship Id="rIdSst" Target="sharedStrings.xml" Type="http://schemas.'
+            b'openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/></Relationships>')
+        partes["[Content_Types].xml"] = partes["[Content_Types].xml"].replace(
+            b"</Types>", b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-'
+            b'officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+    partes["xl/worksheets/sheet2.xml"] = xml.encode()
+
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as zout:
+        for nome, dados in partes.items():
+            zout.writestr(nome, dados)
+    return saida.getvalue()
+
+
+@pytest.mark.parametrize("semente", range(40))
+def test_endereco_antigo_igual_ao_load_workbook(semente):
+    rng = np.random.default_rng(semente)
+    conteudo = _planilha_antiga(rng, epoca_1904=semente % 4 == 3, xml_crus=int(rng.integers(0, 5)),
+                                compartilhados=semente % 2 == 0)
+    assert ler_endereco_antigo(conteudo) == _endereco_load_workbook(conteudo)
+
+def test_endereco_antigo_sem_linha_de_dados_e_pedido_gerado():
+    casos = [_planilha_antiga(np.random.default_rng(0), sem_linha=True), _pedido(5, "ANTIGO")]
+    with open(TEMPLATE_PADRAO, "rb") as f:
+        casos.append(f.read())
+    for conteudo in casos:
+        assert ler_endereco_antigo(conteudo) == _endereco_load_workbook(conteudo)
+
+def test_enderecos_antigos_em_lote(tmp_path):
+    caminhos = []
+    for i in range(6):
+        caminho = tmp_path / f"antiga_{i}.xlsx"
+        caminho.write_bytes(_planilha_antiga(np.random.default_rng(100 + i), xml_crus=2))
+        caminhos.append(str(caminho))
+    quebrado = tmp_path / "quebrado.xlsx"
+    quebrado.write_bytes(b"nao e um zip")
+    caminhos += [str(quebrado), str(tmp_path / "sumiu.xlsx")]
+
+    enderecos, falhas = ler_enderecos_antigos(caminhos)
+    assert set(falhas) == {str(quebrado), str(tmp_path / "sumiu.xlsx")}
+    for caminho in caminhos[:6]:
+        with open(caminho, "rb") as f:
+            assert enderecos[caminho] == _endereco_load_workbook(f.read())
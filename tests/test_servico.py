@@ -0,0 +1,154 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+
+import openpyxl
+import pytest
+import requests
+
+from historico import HistoricoPedidos
+from planilha import ABA_BENEFICIARIOS, PRIMEIRA_LINHA, PRODUTOS
+from servico import ClienteServico, ErroServico, servir
+
+CONFIG = {'Local de entrega': "MATRIZ", 'CEP': "01310918", 'Endereço': "Av Paulista", 'Número': "1000",
+          'Complemento': "", 'Referência': "", 'Bairro': "Bela Vista", 'Cidade': "Sao Paulo", 'UF': "SP",
+          'Responsável': "Ana", 'DDD': "11", 'Telefone': "999999999", 'Email': "", 'Porta_a_Porta': "Não"}
+
+
+def _cpf(i):
+    base = [int(d) for d in f"{i + 100000000:09d}"]
+    for pesos in (range(10, 1, -1), range(11, 1, -1)):
+        resto = sum(d * p for d, p in zip(base, pesos)) * 10 % 11
+        base.append(resto % 10)
+    return "".join(map(str, base))
+
+def _csv(n, invalidos=0):
+    linhas = ["Nome,CPF,Nascimento,Valor"]
+    linhas += [f"PESSOA {i},{_cpf(i)},01/01/1990,\"150,00\"" for i in range(n)]
+    linhas += [f"RUIM {i},11111111111,01/01/1990,10" for i in range(invalidos)]
+    return "\n".join(linhas).encode("utf-8")
+
+
+@pytest.fixture(scope="module")
+def historico(tmp_path_factory):
+    return HistoricoPedidos(str(tmp_path_factory.mktemp("historico") / "h.sqlite3"))
+
+
+@pytest.fixture(scope="module")
+def url(historico):
+    # Um worker e uma vaga de espera: o terceiro pedido simultâneo recebe 429
+    pronto = threading.Event()
+    porta = {}
+    loop = asyncio.new_event_loop()
+
+    def ouvindo(servidor):
+        porta['numero'] = servidor.sockets[0].getsockname()[1]
+        pronto.set()
+
+    tarefa = loop.create_task(servir("127.0.0.1", 0, workers=1, fila=1, timeout=120, pronto=ouvindo,
+                                   historico_path=historico.db_path))
+
+    def rodar():
+        try:
+            loop.run_until_complete(tarefa)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=rodar, daemon=True)
+    thread.start()
+    assert pronto.wait(30)
+    yield f"http://127.0.0.1:{porta['numero']}"
+    loop.call_soon_threadsafe(tarefa.cancel)
+    thread.join(30)
+
+
+def _esperar(cliente, id_pedido):
+    estados = list(cliente.acompanhar(id_pedido))
+    assert estados[-1]['status'] in ('pronto', 'erro', 'cancelado')
+    return estados
+
+def _ate(condicao, limite=60):
+    fim = time.time() + limite
+    while not condicao():
+        assert time.time() < fim
+        time.sleep(0.05)
+
+
+def test_gera_e_baixa_o_pedido(url):
+    cliente = ClienteServico(url)
+    id_pedido = cliente.enviar("lista.csv", _csv(30, invalidos=2), False, "ACME", CONFIG)
+    estados = _esperar(cliente, id_pedido)
+
+    assert estados[-1]['status'] == 'pronto'
+    assert estados[-1]['feitos'] == estados[-1]['total'] == 30
+    assert estados[-1]['rejeitados'] == 2
+
+    ws = openpyxl.load_workbook(io.BytesIO(cliente.arquivo(id_pedido)), read_only=True)[ABA_BENEFICIARIOS]
+    nomes = [r[2] for r in ws.iter_rows(min_row=PRIMEIRA_LINHA, values_only=True) if r[2]]
+    assert len(nomes) == 30 * len(PRODUTOS)
+    assert cliente.rejeitados(id_pedido).decode("utf-8-sig").count("RUIM") == 2
+    assert requests.get(f"{url}/pedidos/{id_pedido}").json()['status'] == 'pronto'
+
+
+def test_fila_cheia_e_pedido_ainda_na_fila(url):
+    cliente = ClienteServico(url)
+    grande = _csv(60000)
+    primeiro = cliente.enviar("a.csv", grande, False, "A", CONFIG)
+    segundo = cliente.enviar("b.csv", grande, False, "B", CONFIG)
+
+    resp = requests.post(f"{url}/pedidos", json={'arquivo': "c.csv", 'conteudo_base64': "", 'config_rh': CONFIG})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"]
+
+    # O segundo está esperando o primeiro: sem arquivo ainda, e o DELETE tira ele da fila
+    assert requests.get(f"{url}/pedidos/{segundo}/arquivo").status_code == 409
+    assert requests.delete(f"{url}/pedidos/{segundo}").status_code == 204
+    assert requests.get(f"{url}/pedidos/{segundo}").status_code == 404
+
+    assert _esperar(cliente, primeiro)[-1]['status'] == 'pronto'
+    assert requests.get(f"{url}/saude").json()['ativos'] == 0
+
+
+def test_recarga_entra_no_historico_so_quando_pronta(url, historico):
+    cliente = ClienteServico(url)
+    id_pedido = cliente.enviar("lista.csv", _csv(30), True, "ACME", CONFIG)
+    assert _esperar(cliente, id_pedido)[-1]['status'] == 'pronto'
+    _ate(lambda: historico.gerado_em("RECARGA_ACME") is not None)
+
+    # Descartada enquanto gera: o processo termina, mas a recarga não vira a "última" do cliente
+    id_pedido = cliente.enviar("lista.csv", _csv(40000), True, "DESCARTADA", CONFIG)
+    for estado in cliente.acompanhar(id_pedido):
+        if estado['status'] == 'gerando':
+            break
+    assert requests.delete(f"{url}/pedidos/{id_pedido}").status_code == 204
+    _ate(lambda: requests.get(f"{url}/saude").json()['ativos'] == 0)
+    # Um pedido depois dele passa pela mesma vaga do pool que o histórico usaria
+    assert _esperar(cliente, cliente.enviar("lista.csv", _csv(5), False, "X", CONFIG))[-1]['status'] == 'pronto'
+    assert historico.gerado_em("RECARGA_DESCARTADA") is None
+
+
+def test_erros(url):
+    assert requests.get(f"{url}/pedidos/nao-existe").status_code == 404
+    assert requests.get(f"{url}/pedidos/nao-existe/arquivo").status_code == 404
+    assert requests.get(f"{url}/nada").status_code == 404
+    assert requests.post(f"{url}/pedidos", data=b"{}").status_code == 400
+    assert requests.post(f"{url}/pedidos", json={'arquivo': "x.pdf", 'conteudo_base64': "", 'config_rh': {}}
+                         ).status_code == 400
+
+    cliente = ClienteServico(url)
+    id_pedido = cliente.enviar("ruim.xlsx", b"isto nao e um xlsx", False, "ACME", CONFIG)
+    assert _esperar(cliente, id_pedido)[-1]['status'] == 'erro'
+    with pytest.raises(ErroServico):
+        cliente.arquivo(id_pedido)
+
+
+def test_content_length_invalido(url):
+    host, porta = url.rsplit("/", 1)[-1].split(":")
+    with socket.create_connection((host, int(porta)), timeout=10) as s:
+        s.sendall(b"POST /pedidos HTTP/1.1\r\nHost: x\r\nContent-Length: abc\r\n\r\n")
+        resposta = s.recv(4096).decode("latin-1")
+    assert resposta.startswith("HTTP/1.1 400")
+    assert "Content-Length" in json.loads(resposta.split("\r\n\r\n", 1)[1])['erro']
@@ -0,0 +1,211 @@
+import random
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil import parser
+
+from tratamento import (MOTIVOS_CPF, classificar_data, converter_data, formatar_nome_pluxee, limpar_cpf, limpar_valor,
+                        motivos_cpf, normalizar_lista, separar_rejeitados)
+
+NOMES = ["João da Silva", "  maria SOUZA ", "NOME: Zé Ninguém", "CPF-Ana", "ç ã ü ñ", "x",
+         "Maria Aparecida dos Santos Pereira de Oliveira Nascimento Costa",
+         "Pedro de Alcântara Francisco Antônio João Carlos Xavier de Paula Miguel Rafael",
+         "", "   ", None, np.nan, 0, 123, "nasc. Carla"]
+CPFS = ["123.456.789-09", "12345678909", "1234567", "CPF: 987.654.321-00", 12345678909, 1234567.0,
+        "", None, np.nan, "abc", "000.000.001-91"]
+DATAS = ["01/02/1990", "1/2/90", "31-12-85", "99/99/9999", "nasc 15/07/2001 x", "2001-07-15", "04/13/1985",
+         "31/02/2020", datetime(1985, 3, 4), date(1970, 1, 1), pd.Timestamp("1999-12-31"), 32874, 32874.0, 1985,
+         0, "", False, None, np.nan, pd.NaT, "  ", "abc"]
+VALORES = ["R$ 1.234,56", "1.234,56", "1234,5", "1,5", "1.5", "R$1500", " 200 ", "abc", "1_000", "inf", "",
+           150, 150.75, 0, None, np.nan, "r$ 10,00"]
+
+
+def _referencia(data_rows, c_nome, c_cpf, c_nasc=None, c_valor=None):
+    """O laço linha a linha original (iterrows + funções escalares)."""
+    linhas = []
+    for _, r in data_rows.iterrows():
+        v_n, v_c = r.get(c_nome), r.get(c_cpf)
+        if isinstance(v_n, pd.Series): v_n = v_n.iloc[0]
+        if isinstance(v_c, pd.Series): v_c = v_c.iloc[0]
+        if pd.isna(v_n) or str(v_n).strip() == "" or pd.isna(v_c):
+            continue
+        nf, cpfl = formatar_nome_pluxee(v_n), limpar_cpf(v_c)
+        v_nasc = r.get(c_nasc) if c_nasc else None
+        if isinstance(v_nasc, pd.Series): v_nasc = v_nasc.iloc[0]
+        nasc = converter_data(v_nasc, "01/01/1980") if v_nasc else "01/01/1980"
+        valor_final = 0
+        if c_valor:
+            v_val = r.get(c_valor)
+            if isinstance(v_val, pd.Series): v_val = v_val.iloc[0]
+            valor_final = limpar_valor(v_val)
+        linhas.append((nf, cpfl, nasc, float(valor_final)))
+    return linhas
+
+def _lista_fuzz(semente, n=400):
+    rnd = random.Random(semente)
+    dados = {
+        'nome': [rnd.choice(NOMES) for _ in range(n)],
+        'cpf': [rnd.choice(CPFS) for _ in range(n)],
+        'nascimento': [rnd.choice(DATAS) for _ in range(n)],
+        'valor': [rnd.choice(VALORES) for _ in range(n)],
+    }
+    return pd.DataFrame(dados, dtype=object)
+
+def _comparar(data_rows, *colunas):
+    esperado = _referencia(data_rows, *colunas)
+    lista = normalizar_lista(data_rows, *colunas)
+    obtido = [(n, c, d, float(v)) for n, c, d, v in lista.itertuples(index=False, name=None)]
+    assert obtido == esperado
+
+
+@pytest.mark.parametrize("semente", range(5))
+def test_normalizar_lista_igual_ao_laco(semente):
+    _comparar(_lista_fuzz(semente), 'nome', 'cpf', 'nascimento', 'valor')
+
+
+@pytest.mark.parametrize("semente", range(3))
+def test_sem_nascimento_e_sem_valor(semente):
+    _comparar(_lista_fuzz(semente), 'nome', 'cpf', None, None)
+    _comparar(_lista_fuzz(semente), 'nome', 'cpf', 'nao existe', 'nem esta')
+
+
+@pytest.mark.parametrize("semente", range(3))
+def test_colunas_com_nome_repetido(semente):
+    a, b = _lista_fuzz(semente), _lista_fuzz(semente + 100)
+    data_rows = pd.concat([a, b], axis=1)
+    # Duas colunas "nome", "cpf" etc.: vale a primeira, como r.get(...).iloc[0]
+    assert list(data_rows.columns).count('nome') == 2
+    _comparar(data_rows, 'nome', 'cpf', 'nascimento', 'valor')
+
+
+def test_nascimento_falso_cai_no_padrao():
+    data_rows = pd.DataFrame({'nome': ["A", "B", "C", "D"], 'cpf': ["1", "2", "3", "4"],
+                              'nasc': [0, "", False, np.nan]}, dtype=object)
+    lista = normalizar_lista(data_rows, 'nome', 'cpf', 'nasc')
+    assert list(lista['nascimento']) == ["01/01/1980"] * 4
+    _comparar(data_rows, 'nome', 'cpf', 'nasc', None)
+
+
+def test_valor_com_milhar_e_moeda():
+    data_rows = pd.DataFrame({'nome': ["A"], 'cpf': ["1"], 'valor': ["R$ 1.234,56"]}, dtype=object)
+    assert normalizar_lista(data_rows, 'nome', 'cpf', None, 'valor')['valor'].iloc[0] == 1234.56
+
+
+def _converter_data_antigo(data_bruta, data_padrao):
+    # converter_data do app antes do caminho rápido (só dateutil)
+    if pd.isna(data_bruta) or str(data_bruta).strip() == "":
+        return data_padrao
+    try:
+        return parser.parse(str(data_bruta).replace('-', '/'), dayfirst=True, fuzzy=True).strftime('%d/%m/%Y')
+    except Exception:
+        return data_padrao
+
+
+@pytest.mark.parametrize("numero", [1031985, 1031985.0, 15071990, 3121999, 99999, 60000, 2958465])
+def test_numero_fora_da_janela_de_nascimento_segue_o_caminho_antigo(numero):
+    assert converter_data(numero, "01/01/1980") == _converter_data_antigo(numero, "01/01/1980")
+    assert classificar_data(numero)[1] != 'serial'
+
+
+def test_serial_do_excel_ate_hoje():
+    hoje = (datetime.now() - datetime(1899, 12, 30)).days
+    assert classificar_data(32874) == ("01/01/1990", 'serial')
+    assert classificar_data(hoje) == (datetime.now().strftime('%d/%m/%Y'), 'serial')
+    assert classificar_data(hoje + 1)[1] != 'serial'
+
+
+def _motivo_referencia(cpf, ja_vistos):
+    """Validação escalar de um CPF (já limpo), direto da regra dos dígitos verificadores."""
+    if len(cpf) != 11 or not (cpf.isascii() and cpf.isdigit()):
+        return 'tamanho'
+    d = [int(c) for c in cpf]
+    if len(set(d)) == 1:
+        return 'repetidos'
+    dv1 = sum(d[i] * (10 - i) for i in range(9)) * 10 % 11 % 10
+    dv2 = sum(d[i] * (11 - i) for i in range(10)) * 10 % 11 % 10
+    if (dv1, dv2) != (d[9], d[10]):
+        return 'verificador'
+    if cpf in ja_vistos:
+        return 'duplicado'
+    ja_vistos.add(cpf)
+    return None
+
+def _cpf_valido(rnd):
+    d = [rnd.randrange(10) for _ in range(9)]
+    for pesos in (range(10, 1, -1), range(11, 1, -1)):
+        d.append(sum(x * p for x, p in zip(d, pesos)) * 10 % 11 % 10)
+    return "".join(map(str, d))
+
+def _cpfs_fuzz(semente, n=600):
+    rnd = random.Random(semente)
+    validos = [_cpf_valido(rnd) for _ in range(n // 4)]
+    cpfs = []
+    for _ in range(n):
+        tipo = rnd.random()
+        if tipo < 0.5:
+            cpfs.append(rnd.choice(validos))  # com repetição: duplicados
+        elif tipo < 0.65:
+            c = list(rnd.choice(validos))
+            i = rnd.randrange(11)
+            c[i] = str((int(c[i]) + rnd.randrange(1, 10)) % 10)
+            cpfs.append("".join(c))
+        elif tipo < 0.75:
+            cpfs.append(str(rnd.randrange(10)) * 11)
+        elif tipo < 0.85:
+            cpfs.append(rnd.choice(validos) + str(rnd.randrange(10)))
+        else:
+            cpfs.append(rnd.choice(["", "123", "1234567890a", "١٢٣٤٥٦٧٨٩٠٩"]))
+    return cpfs
+
+
+@pytest.mark.parametrize("semente", range(5))
+def test_motivos_cpf_igual_a_validacao_escalar(semente):
+    cpfs = _cpfs_fuzz(semente)
+    ja_vistos = set()
+    esperado = [_motivo_referencia(c, ja_vistos) for c in cpfs]
+    assert list(motivos_cpf(cpfs)) == esperado
+
+
+@pytest.mark.parametrize("semente", range(3))
+def test_duplicados_entre_lotes(semente):
+    cpfs = _cpfs_fuzz(semente)
+    ja_vistos = set()
+    esperado = [_motivo_referencia(c, ja_vistos) for c in cpfs]
+    vistos, obtido = set(), []
+    for inicio in range(0, len(cpfs), 97):
+        obtido += list(motivos_cpf(cpfs[inicio:inicio + 97], vistos))
+    assert obtido == esperado
+    assert vistos == ja_vistos
+
+
+def test_casos_conhecidos():
+    assert list(motivos_cpf(["52998224725", "11111111111", "529982247250", "", None, "52998224726",
+                             "52998224725"])) == [None, 'repetidos', 'tamanho', 'tamanho', 'tamanho', 'verificador',
+                                                  'duplicado']
+
+
+def test_separar_rejeitados_fica_com_o_primeiro():
+    lista = pd.DataFrame({'nome': ["ANA", "BIA", "CAIO", "DANI"], 'cpf': ["52998224725", "11111111111",
+                                                                          "52998224725", "12345678909"],
+                          'nascimento': ["01/01/1990"] * 4, 'valor': [1.0, 2.0, 3.0, 4.0]})
+    aceitos, rejeitados = separar_rejeitados(lista)
+    assert list(aceitos['nome']) == ["ANA", "DANI"]
+    assert list(aceitos['valor']) == [1.0, 4.0]
+    assert list(rejeitados['nome']) == ["BIA", "CAIO"]
+    assert list(rejeitados['motivo']) == [MOTIVOS_CPF['repetidos'], MOTIVOS_CPF['duplicado']]
+
+    # Em lotes, o CPF aceito num lote recusa o mesmo CPF nos seguintes
+    vistos = set()
+    separar_rejeitados(lista.iloc[:1], vistos)
+    aceitos, rejeitados = separar_rejeitados(lista.iloc[1:], vistos)
+    assert list(aceitos['nome']) == ["DANI"]
+    assert list(rejeitados['motivo']) == [MOTIVOS_CPF['repetidos'], MOTIVOS_CPF['duplicado']]
+
+
+@pytest.mark.parametrize("nomes", [[NOMES[6]], [NOMES[6], NOMES[7]], [NOMES[6], "x"]])
+def test_nome_longo_em_lista_curta(nomes):
+    # Um lote de uma linha só (fim de uma leitura em lotes) com nome para abreviar
+    data_rows = pd.DataFrame({'nome': nomes, 'cpf': ["1"] * len(nomes)}, dtype=object)
+    _comparar(data_rows, 'nome', 'cpf', None, None)
@@ -0,0 +1,328 @@
+import numbers
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+from dateutil import parser
+
+from medicao import medido
+
+# ==========================================
+# LÓGICA DE TRATAMENTO DE DADOS
+# ==========================================
+
+DATA_PADRAO = "01/01/1980"
+
+
+def _abreviar_nome(nome, limite):
+    partes = nome.split()
+    if len(partes) <= 2:
+        return nome[:limite]
+    primeiro, ultimo = partes[0], partes[-1]
+    meio_original = partes[1:-1]
+    # Abrevia progressivamente: testa abreviando 0, 1, 2... nomes do meio até caber
+    for num_abreviar in range(len(meio_original) + 1):
+        meio = meio_original.copy()
+        for i in range(num_abreviar):
+            if len(meio[i]) > 2:
+                meio[i] = meio[i][0] + "."
+        tentativa = " ".join([primeiro] + meio + [ultimo])
+        if len(tentativa) <= limite:
+            return tentativa
+    return f"{primeiro} {ultimo}"[:limite]
+
+def formatar_nome_pluxee(nome_bruto, limite=40):
+    nome = unidecode(str(nome_bruto)).upper().strip()
+    nome = re.sub(r'^(NASC|CPF|NOME|VALOR)[:.,\s-]*', '', nome)
+    if len(nome) <= limite:
+        return nome
+    return _abreviar_nome(nome, limite)
+
+def formatar_local(texto_bruto, limite=30):
+    if pd.isna(texto_bruto):
+        return ""
+    texto = unidecode(str(texto_bruto)).upper().strip()
+    if len(texto) <= limite:
+        return texto
+    partes = texto.split()
+    if len(partes) <= 2:
+        return texto[:limite]
+    primeiro, ultimo = partes[0], partes[-1]
+    meio_original = partes[1:-1]
+    # Abrevia progressivamente: testa abreviando 0, 1, 2... nomes do meio até caber
+    for num_abreviar in range(len(meio_original) + 1):
+        meio = meio_original.copy()
+        for i in range(num_abreviar):
+            if len(meio[i]) > 2:
+                meio[i] = meio[i][0] + "."
+        tentativa = " ".join([primeiro] + meio + [ultimo])
+        if len(tentativa) <= limite:
+            return tentativa
+    return texto[:limite]
+
+def limpar_cpf(cpf_bruto):
+    if pd.isna(cpf_bruto):
+        return ""
+    cpf_limpo = re.sub(r'\D', '', str(cpf_bruto))
+    return cpf_limpo.zfill(11)
+
+# ==========================================
+# DATAS: CAMINHO RÁPIDO + MEMÓRIA
+# ==========================================
+# O parse "fuzzy" do dateutil é a chamada mais cara por linha. Antes dele,
+# resolvemos direto o que é comum nas listas: células de data do Excel,
+# números de série do Excel e texto dd/mm/aaaa ou dd/mm/aa. O texto que
+# sobra vai para o dateutil, com o resultado guardado num LRU pelo texto.
+
+_RE_DATA_BR = re.compile(r'\s*(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})\s*')
+_ORIGEM_EXCEL = datetime(1899, 12, 30)
+# Série de data de nascimento: de 1927 até hoje. Fora disso (1985 digitado como
+# ano, 1031985 para 01/03/1985 sem o zero) segue o caminho antigo
+SERIAL_EXCEL_MIN = 10000
+MEMO_DATAS_MAX = 65536
+
+CAMINHOS_DATA = {
+    'vazia': "vazias (data padrão)",
+    'data': "células de data",
+    'serial': "números de série do Excel",
+    'formato': "dd/mm/aaaa",
+    'dateutil': "parser flexível",
+    'invalida': "inválidas (data padrão)",
+}
+
+
+def _serial_hoje():
+    return (datetime.now() - _ORIGEM_EXCEL).days
+
+def _ano_dois_digitos(ano):
+    # Mesma janela de 100 anos em torno do ano atual que o dateutil usa
+    atual = datetime.now().year
+    ano += atual // 100 * 100
+    if ano >= atual + 50:
+        ano -= 100
+    elif ano < atual - 50:
+        ano += 100
+    return ano
+
+def _data_no_formato(texto):
+    m = _RE_DATA_BR.fullmatch(texto)
+    if not m:
+        return None
+    dia, mes, ano_txt = m.groups()
+    ano = int(ano_txt)
+    if len(ano_txt) == 2:
+        ano = _ano_dois_digitos(ano)
+    elif ano < 1000:
+        return None
+    try:
+        return datetime(ano, int(mes), int(dia)).strftime('%d/%m/%Y')
+    except ValueError:
+        # Ex.: 04/13/1985 — o dateutil inverte dia e mês, então deixa com ele
+        return None
+
+@lru_cache(maxsize=MEMO_DATAS_MAX)
+def _data_do_texto(data_limpa):
+    data = _data_no_formato(data_limpa)
+    if data is not None:
+        return data, 'formato'
+    try:
+        dt = parser.parse(data_limpa, dayfirst=True, fuzzy=True)
+        return dt.strftime('%d/%m/%Y'), 'dateutil'
+    except:
+        return None, 'invalida'
+
+def classificar_data(data_bruta):
+    """Converte para dd/mm/aaaa e diz por qual caminho passou (chaves de CAMINHOS_DATA).
+
+    Devolve None como data quando o valor é vazio ou não é uma data.
+    """
+    if pd.isna(data_bruta) or str(data_bruta).strip() == "":
+        return None, 'vazia'
+    if isinstance(data_bruta, (datetime, date)):
+        return data_bruta.strftime('%d/%m/%Y'), 'data'
+    if (isinstance(data_bruta, numbers.Real) and not isinstance(data_bruta, bool)
+            and SERIAL_EXCEL_MIN <= data_bruta <= _serial_hoje()):
+        return (_ORIGEM_EXCEL + timedelta(days=int(data_bruta))).strftime('%d/%m/%Y'), 'serial'
+    return _data_do_texto(str(data_bruta).replace('-', '/'))
+
+def limpar_memo_datas():
+    _data_do_texto.cache_clear()
+
+def converter_data(data_bruta, data_padrao):
+    data, _ = classificar_data(data_bruta)
+    return data_padrao if data is None else data
+
+def resumo_datas(contagem):
+    partes = [f"{contagem[c]} {rotulo}" for c, rotulo in CAMINHOS_DATA.items() if contagem.get(c)]
+    return ", ".join(partes)
+
+def _para_float(val_str):
+    try:
+        return float(val_str)
+    except:
+        return 0
+
+def limpar_valor(valor_bruto):
+    """Limpa a string de valor para um número decimal puro (ex: 1500.00)."""
+    if pd.isna(valor_bruto):
+        return 0
+    val_str = str(valor_bruto).upper().replace('R$', '').replace(' ', '').strip()
+    if '.' in val_str and ',' in val_str:
+        val_str = val_str.replace('.', '').replace(',', '.')
+    elif ',' in val_str:
+        val_str = val_str.replace(',', '.')
+    return _para_float(val_str)
+
+# ==========================================
+# NORMALIZAÇÃO EM COLUNAS (LISTA INTEIRA)
+# ==========================================
+# Mesmas regras das funções acima, aplicadas na coluna inteira com operações
+# de string do pandas. O que não vetoriza (unidecode, parse de data) roda uma
+# vez por valor distinto, já que as listas repetem muito datas e valores.
+
+def _coluna(df, nome_col):
+    """Equivalente colunar de `r.get(col)`: primeira coluna se o nome se repete, None se não existe."""
+    if nome_col is None or nome_col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    col = df[nome_col]
+    if isinstance(col, pd.DataFrame):
+        col = col.iloc[:, 0]
+    return col.astype(object)
+
+def _por_valor_distinto(serie, func):
+    codigos, distintos = pd.factorize(serie)
+    resultado = pd.Series([func(v) for v in distintos], dtype=object)
+    return pd.Series(resultado.to_numpy()[codigos], index=serie.index, dtype=object)
+
+def normalizar_nomes(col, limite=40):
+    txt = _por_valor_distinto(col.astype(str), unidecode).astype(str)
+    txt = txt.str.upper().str.strip()
+    txt = txt.str.replace(r'^(NASC|CPF|NOME|VALOR)[:.,\s-]*', '', regex=True)
+    longos = txt.str.len() > limite
+    if longos.any():
+        txt.loc[longos] = [_abreviar_nome(n, limite) for n in txt[longos]]
+    return txt.astype(object)
+
+def normalizar_cpfs(col):
+    cpfs = col.astype(str).str.replace(r'\D', '', regex=True).str.zfill(11).astype(object)
+    return cpfs.mask(col.isna(), "")
+
+def normalizar_datas(col, data_padrao=DATA_PADRAO, contagem=None):
+    """Converte a coluna de nascimento; se `contagem` (Counter) vier, soma quantas linhas foram por cada caminho."""
+    na = col.isna()
+    # O laço original só chamava converter_data para valores "verdadeiros" (0, "" e False caem no padrão)
+    vazio = na | ~col.mask(na, True).astype(bool)
+    datas = pd.Series(data_padrao, index=col.index, dtype=object)
+    caminhos = pd.Series('vazia', index=col.index, dtype=object)
+    validos = col[~vazio]
+    if len(validos):
+        codigos, distintos = pd.factorize(validos)
+        convertidas = [classificar_data(v) for v in distintos]
+        por_valor = pd.DataFrame(convertidas, columns=['data', 'caminho'], dtype=object)
+        datas[~vazio] = por_valor['data'].fillna(data_padrao).to_numpy()[codigos]
+        caminhos[~vazio] = por_valor['caminho'].to_numpy()[codigos]
+    if contagem is not None:
+        contagem.update(caminhos.value_counts().to_dict())
+    return datas
+
+def normalizar_valores(col):
+    txt = col.astype(str).str.upper().str.replace('R$', '', regex=False)
+    txt = txt.str.replace(' ', '', regex=False).str.strip()
+    milhar = txt.str.contains('.', regex=False) & txt.str.contains(',', regex=False)
+    txt = txt.mask(milhar, txt.str.replace('.', '', regex=False))
+    txt = txt.str.replace(',', '.', regex=False)
+    valores = pd.to_numeric(txt, errors='coerce')
+    # O que o to_numeric recusa ainda passa pelo float() do Python ("1_000", "inf"...)
+    falhas = valores.isna() & ~col.isna()
+    if falhas.any():
+        valores[falhas] = _por_valor_distinto(txt[falhas], _para_float).astype(float)
+    return valores.mask(col.isna(), 0).astype(float)
+
+def normalizar_lista(data_rows, c_nome, c_cpf, c_nasc=None, c_valor=None, data_padrao=DATA_PADRAO,
+                     contagem_datas=None):
+    """Versão colunar do laço de geração: devolve nome, cpf, nascimento e valor já tratados.
+
+    Linhas sem nome ou sem CPF são descartadas, como no laço linha a linha.
+    Sem `c_valor` o valor sai zerado (pedido de 1ª via). `contagem_datas`
+    (Counter, opcional) recebe quantas datas saíram por cada caminho.
+    """
+    v_n, v_c = _coluna(data_rows, c_nome), _coluna(data_rows, c_cpf)
+    manter = ~(v_n.isna() | (v_n.astype(str).str.strip() == "") | v_c.isna())
+    v_n, v_c = v_n[manter], v_c[manter]
+
+    lista = pd.DataFrame(index=v_n.index)
+    lista['nome'] = normalizar_nomes(v_n)
+    lista['cpf'] = normalizar_cpfs(v_c)
+    if c_nasc:
+        lista['nascimento'] = normalizar_datas(_coluna(data_rows, c_nasc)[manter], data_padrao, contagem_datas)
+    else:
+        lista['nascimento'] = data_padrao
+        if contagem_datas is not None:
+            contagem_datas['vazia'] += len(lista)
+    if c_valor:
+        lista['valor'] = normalizar_valores(_coluna(data_rows, c_valor)[manter])
+    else:
+        lista['valor'] = 0
+    return lista.reset_index(drop=True)
+
+# ==========================================
+# VALIDAÇÃO DE CPF
+# ==========================================
+# A Pluxee recusa o arquivo inteiro por CPF inválido ou repetido. Antes de
+# gravar, a coluna toda vira uma matriz de dígitos (uma linha por CPF) e os
+# dois dígitos verificadores são calculados de uma vez com NumPy. Repetidos
+# saem por hash (o primeiro fica, os seguintes são recusados).
+
+MOTIVOS_CPF = {
+    'tamanho': "CPF com mais de 11 dígitos ou vazio",
+    'repetidos': "CPF com todos os dígitos iguais",
+    'verificador': "Dígito verificador não confere",
+    'duplicado': "CPF repetido na lista",
+}
+_PESOS_DV1 = np.arange(10, 1, -1)
+_PESOS_DV2 = np.arange(11, 1, -1)
+
+
+def motivos_cpf(cpfs, vistos=None):
+    """Motivo de recusa de cada CPF (chave de MOTIVOS_CPF) ou None se está ok.
+
+    `cpfs` são os CPFs já limpos (só dígitos, 11 posições). `vistos` (set,
+    opcional) guarda os CPFs aceitos em lotes anteriores, para achar repetidos
+    entre lotes; os aceitos deste lote entram nele.
+    """
+    cpfs = pd.Series(cpfs, dtype=object).fillna("").astype(str).reset_index(drop=True)
+    motivos = np.full(len(cpfs), None, dtype=object)
+    formato_ok = (cpfs.str.len() == 11) & cpfs.str.isascii() & cpfs.str.isdigit()
+    motivos[~formato_ok.to_numpy()] = 'tamanho'
+
+    posicoes = np.flatnonzero(formato_ok.to_numpy())
+    if len(posicoes):
+        texto = "".join(cpfs.to_numpy()[posicoes]).encode("ascii")
+        digitos = (np.frombuffer(texto, dtype=np.uint8) - ord("0")).reshape(-1, 11).astype(np.int64)
+        dv1 = digitos[:, :9] @ _PESOS_DV1 * 10 % 11 % 10
+        dv2 = digitos[:, :10] @ _PESOS_DV2 * 10 % 11 % 10
+        repetidos = (digitos == digitos[:, :1]).all(axis=1)
+        errados = (dv1 != digitos[:, 9]) | (dv2 != digitos[:, 10])
+        motivos[posicoes[errados]] = 'verificador'
+        motivos[posicoes[repetidos]] = 'repetidos'
+
+    validos = pd.isna(motivos)
+    duplicados = cpfs.duplicated().to_numpy() & validos
+    if vistos is not None:
+        duplicados |= cpfs.isin(vistos).to_numpy() & validos
+        vistos.update(cpfs[validos & ~duplicados])
+    motivos[duplicados] = 'duplicado'
+    return motivos
+
+@medido("validacao_cpf")
+def separar_rejeitados(lista, vistos=None):
+    """Divide a lista tratada em (aceitos, rejeitados); rejeitados tem nome, cpf e motivo."""
+    motivos = motivos_cpf(lista['cpf'], vistos)
+    recusado = ~pd.isna(motivos)
+    aceitos = lista[~recusado].reset_index(drop=True)
+    rejeitados = lista.loc[recusado, ['nome', 'cpf']].reset_index(drop=True)
+    rejeitados['motivo'] = [MOTIVOS_CPF[m] for m in motivos[recusado]]
+    return aceitos, rejeitados